@@ -1,9 +1,23 @@
 import lvgl as lv
 import arequests
+import asyncio
+from array import array
+import gc
+import hashlib
+import io
+import json
+import os
+import random
 import time
 import net
 import peripherals
 
+try:
+    import deflate
+except ImportError:
+    # firmware without the deflate module, responses are requested uncompressed
+    deflate = None
+
 # Name of the App
 NAME = "HK Weather"
 
@@ -33,6 +47,9 @@ lbl_humidity = None
 lbl_humidity_percent = None
 lbl_station = None
 lbl_hko_updtime = None
+chart_trend = None
+chart_temp_series = None
+chart_humidity_series = None
 lbl_status_panel = None
 lbl_status = None
 icon_shelly = None
@@ -45,22 +62,40 @@ lbl_shelly_updtime = None
 btn_forecast = None
 obj_forecast = []
 
-# HKO weather data
+# HKO weather data, the readings are those of the station shown
 station = None
+stations = []
+current_station = 0
+STATION_DATASETS = ('temperature', 'humidity', 'temperature_maxmin')
+# readings of every station in the last regional CSVs: dataset -> {station: (kpi, kpi_time)}
+station_index = {}
 temp = None
 temp_updtime = None
 humidity = None
 humidity_updtime = None
 temp_maxmin = None
 temp_maxmin_updtime = None
-# icon_idx = None
-# icon_updtime = None
+icon_idx = None
+icon_updtime = None
+# record time of the readings in the last current weather report
+current_updtime = None
 forecast_data = None
 forecast_updtime = None
-weather_icons = []
+warning_icons = []
+# hash of the last warning summary, the details are fetched again when it changes
+warnsum_digest = None
 obj_warnings = []
 MAX_WARNINGS = 5
 
+# History of the primary station and indoor readings, x10 integers sampled every HISTORY_INTERVAL_MS
+HISTORY_INTERVAL_MS = 10 * 60 * 1000
+HISTORY_SIZE = 24 * 60 * 60 * 1000 // HISTORY_INTERVAL_MS
+HISTORY_TEMP = 0
+HISTORY_HUMIDITY = 1
+HISTORY_INDOOR_TEMP = 2
+HISTORY_INDOOR_HUMIDITY = 3
+last_history_ticks_ms = None
+
 # Shelly data
 enable_shelly = False
 shelly_tc = None
@@ -68,18 +103,94 @@ shelly_rh = None
 shelly_updtime = None
 
 # states control
-pending_retrieval = False
 pending_refresh_ui = False
+# screen sections still to be built, one per tick after the first frame
+pending_builds = []
+
+# background retrieval: idle -> fetching (task running) -> publishing (results waiting for the tick) -> idle
+RETRIEVAL_IDLE = 0
+RETRIEVAL_FETCHING = 1
+RETRIEVAL_PUBLISHING = 2
+retrieval_state = RETRIEVAL_IDLE
+retrieval_task = None
+# (start ticks, results) of the last fetch, results is name -> result or exception of
+# each dataset that finished and is not published yet; the tick publishes them as they arrive
+retrieval_results = None
+
+# last value pushed to each widget: (id(widget), property) -> value
+ui_values = {}
+# no of widget updates made by the last update_ui()
+ui_updates = 0
+
+# fetch and update_ui() instrumentation, see Metrics; exported to METRICS_FILE when the diagnostics page opens
+METRICS_SIZE = 32
+METRICS_FILE = f'/apps/{NAME}/metrics.json'
+
+# diagnostics page, opened by pressing the knob DIAGNOSTICS_PRESSES times within DIAGNOSTICS_GESTURE_MS
+DIAGNOSTICS_PRESSES = 3
+DIAGNOSTICS_GESTURE_MS = 1500
+enter_presses = []
+diagnostics_shown = False
+obj_diagnostics = None
+lbl_diagnostics = None
+
+# icon files kept in RAM as read from flash: LVGL path -> image descriptor of the PNG file bytes,
+# least recently used first in image_lru. This saves the file reads only, LVGL still decodes the
+# PNG on every set_src(); IMAGE_CACHE_BYTES bounds the file sizes held, not decoded memory
+IMAGE_CACHE_BYTES = 64 * 1024
+# where LVGL's 'A:' drive is mounted
+LVGL_DRIVE_ROOT = '/'
+image_cache = {}
+image_lru = []
+image_cache_bytes = 0
 
 # counters
 REFRESH_INTERVAL_MS = 10 * 60 * 1000
 PAGE_SWITCH_INTERVAL_MS = 15 * 1000
-last_refresh_ticks_ms = None
-last_switch_ticks_ms = None
+
+# per-dataset refresh schedule: name -> (HKO publishing cadence s, publishing lag s, longest wait s)
+# the next fetch is planned for publication time + cadence + lag, kept within
+# MIN_REFRESH_DELAY and the longest wait, plus up to REFRESH_JITTER seconds
+REFRESH_SCHEDULE = {
+    'temperature': (60, 20, REFRESH_INTERVAL_MS // 1000),
+    'humidity': (60, 20, REFRESH_INTERVAL_MS // 1000),
+    'temperature_maxmin': (10 * 60, 60, 30 * 60),
+    'weather': (60 * 60, 5 * 60, 60 * 60),
+    'current': (10 * 60, 2 * 60, REFRESH_INTERVAL_MS // 1000),
+    'forecast': (6 * 60 * 60, 10 * 60, 60 * 60),
+    # the warning details are fetched when the summary polled every minute changes, or hourly
+    'warnsum': (0, 0, 60),
+    'warnings': (0, 0, 60 * 60),
+    'shelly': (0, 0, REFRESH_INTERVAL_MS // 1000),
+}
+MIN_REFRESH_DELAY = 60
+REFRESH_JITTER = 15
+next_refresh_ticks_ms = {}
+# publication time seen by the last fetch of each dataset, and the fetches in a row that it did not
+# advance; each of these doubles the delay, up to the longest wait
+last_published = {}
+unchanged_fetches = {}
+
+# failed datasets: name -> consecutive failures. The retry waits RETRY_BASE_DELAY seconds, doubled
+# per failure. From BREAKER_THRESHOLD failures on the circuit breaker of the dataset is open: it is
+# only probed every BREAKER_PROBE_DELAY seconds with a BREAKER_PROBE_DEADLINE, and refresh
+# requests skip it until a probe succeeds
+RETRY_BASE_DELAY = 30
+BREAKER_THRESHOLD = 4
+BREAKER_PROBE_DELAY = 30 * 60
+BREAKER_PROBE_DEADLINE = 5
+fetch_failures = {}
+
+# while the app is hidden due datasets are fetched at most once per interval
+BACKGROUND_REFRESH_INTERVAL_MS = REFRESH_INTERVAL_MS
+last_background_ticks_ms = None
 
 # page control
 current_page = 0
 
+# first forecast day shown, the forecast cells are reused as the strip scrolls
+forecast_offset = 0
+
 # weather icon control
 current_icon = 0
 
@@ -89,6 +200,21 @@ error_message = ''
 # global network timeout
 NETWORK_TIMEOUT=15
 
+# concurrent fetch control
+MAX_CONCURRENT_FETCHES = 3
+REFRESH_DEADLINE = 30
+FETCH_DEADLINES = {
+    'temperature': 10,
+    'humidity': 10,
+    'temperature_maxmin': 10,
+    'weather': NETWORK_TIMEOUT,
+    'current': NETWORK_TIMEOUT,
+    'forecast': NETWORK_TIMEOUT,
+    'warnsum': 10,
+    'warnings': NETWORK_TIMEOUT,
+    'shelly': 5,
+}
+
 # No of days to show in forecast panel
 MAX_HKO_FORECAST_DAYS=9
 DEFAULT_FORECAST_DAYS="6"
@@ -125,6 +251,27 @@ forecast_config = {
 # Default HKO station
 DEFAULT_LOCATION = 'Peng Chau'
 
+# HKO stations in the regional weather CSVs
+HKO_STATIONS = (
+    "Chek Lap Kok", "Cheung Chau", "Clear Water Bay", "Happy Valley", "HK Observatory", "HK Park",
+    "Kai Tak Runway Park", "Kau Sai Chau", "King's Park", "Kowloon City", "Kwun Tong", "Lau Fau Shan",
+    "Ngong Ping", "Pak Tam Chung", "Peng Chau", "Sai Kung", "Sha Tin", "Sham Shui Po", "Shau Kei Wan",
+    "Shek Kong", "Sheung Shui", "Stanley", "Ta Kwu Ling", "Tai Lung", "Tai Mei Tuk", "Tai Mo Shan",
+    "Tai Po", "Tate's Cairn", "The Peak", "Tseung Kwan O", "Tsing Yi", "Tsuen Wan Ho Koon",
+    "Tsuen Wan Shing Mun Valley", "Tuen Mun", "Waglan Island", "Wetland Park", "Wong Chuk Hang",
+    "Wong Tai Sin", "Yuen Long Park",
+)
+
+# Source of the station readings: the regional CSVs, or the current weather report (rhrread)
+# which also has the weather icon, with the CSVs only fetched for the stations it does not cover
+DATA_SOURCE_CSV = 'csv'
+DATA_SOURCE_RHRREAD = 'rhrread'
+data_source = DATA_SOURCE_CSV
+# places named differently in the current weather report
+RHRREAD_PLACES = {'Hong Kong Observatory': 'HK Observatory', 'Hong Kong Park': 'HK Park'}
+# stations covered by the last current weather report: dataset -> tuple of stations
+rhrread_places = {}
+
 # API URLs
 api_url = {
     'weather': 'https://data.weather.gov.hk/weatherAPI/opendata/weather.php?dataType=rhrread&lang=en',
@@ -132,13 +279,241 @@ api_url = {
     'humidity': 'https://data.weather.gov.hk/weatherAPI/hko_data/regional-weather/latest_1min_humidity.csv',
     'temperature_maxmin': 'https://data.weather.gov.hk/weatherAPI/hko_data/regional-weather/latest_since_midnight_maxmin.csv',
     'forecast': 'https://data.weather.gov.hk/weatherAPI/opendata/weather.php?dataType=fnd&lang=en',
+    'warnsum': 'https://data.weather.gov.hk/weatherAPI/opendata/weather.php?dataType=warnsum&lang=en',
     'warnings': 'https://data.weather.gov.hk/weatherAPI/opendata/weather.php?dataType=warningInfo&lang=en',
 }
 shelly_url = ''
 
+# JSON members used from each HKO dataset, everything else is skipped while parsing
+FORECAST_FIELDS = ('forecastDate', 'week', 'forecastMaxtemp', 'forecastMintemp', 'forecastMaxrh', 'forecastMinrh',
+                   'ForecastIcon')
+json_paths = {
+    'weather': ('icon', 'iconUpdateTime'),
+    'current': ('icon', 'iconUpdateTime', 'temperature.recordTime', 'temperature.data.*.place',
+                'temperature.data.*.value', 'humidity.recordTime', 'humidity.data.*.place', 'humidity.data.*.value'),
+    'forecast': ('updateTime',) + tuple('weatherForecast.*.' + field for field in FORECAST_FIELDS),
+    'warnings': ('details.*.subtype', 'details.*.warningStatementCode'),
+}
+
+# streaming response readers, bodies are read with readinto() straight into buffers
+# that are allocated at boot, one per concurrent fetch, and reused by every fetch
+READ_CHUNK_SIZE = 256
+CSV_LINE_SIZE = 256
+read_buffers = []
+
+# compressed transfer: base-2 log of the LZ77 window the decompressor keeps, and compressed
+# bytes buffered ahead of it, enough for any READ_CHUNK_SIZE piece of decompressed output;
+# the InflateInput buffers are pooled like read_buffers
+INFLATE_WBITS = 15
+INFLATE_INPUT_SIZE = 4 * READ_CHUNK_SIZE
+inflate_inputs = []
+
+# last good dataset kept on flash for a warm start after reboot
+DATA_FILE = f'/apps/{NAME}/last_data.txt'
+DATA_FILE_VERSION = 'HKW1'
+PERSISTED_FIELDS = ('station', 'temp', 'temp_updtime', 'humidity', 'humidity_updtime', 'temp_maxmin',
+                    'temp_maxmin_updtime', 'icon_idx', 'icon_updtime', 'forecast_data', 'forecast_updtime',
+                    'warning_icons', 'shelly_tc', 'shelly_rh', 'shelly_updtime')
+saved_data = None
+data_stale = False
+# flash is written at most every SAVE_INTERVAL_MS after a fetch, and when the app stops
+SAVE_INTERVAL_MS = 10 * 60 * 1000
+last_save_ticks_ms = None
+
+# display-ready copy of the data above, replaced as a whole on every publish
+snapshot = None
+
+# keep-alive HTTPS connections to the HKO host
+HKO_HOST = 'data.weather.gov.hk'
+HTTP_POOL_SIZE = MAX_CONCURRENT_FETCHES
+# above the shortest poll interval, MIN_REFRESH_DELAY plus REFRESH_JITTER, so polls find a live connection
+HTTP_IDLE_TIMEOUT_MS = 90 * 1000
+HTTP_DRAIN_LIMIT = 4 * 1024
+
+# HTTP response cache: url -> (etag, last_modified, variant, parsed data)
+http_cache = {}
+
 def format_hko_date(date_str):
     return "{}-{}-{} {}:{}:00".format(date_str[:4], date_str[4:6], date_str[6:8], date_str[8:10], date_str[10:12])
 
+class History:
+    """Fixed-capacity ring buffer of samples, each a row of series values stored in one array('h').
+
+    Values are scaled integers, MISSING marks a reading that was not available.
+    Appending overwrites the oldest row once the buffer is full.
+    """
+
+    MISSING = -32768
+
+    def __init__(self, series, capacity):
+        self.series = series
+        self.capacity = capacity
+        self.data = array('h', [History.MISSING] * (series * capacity))
+        self.head = 0
+        self.count = 0
+        # no of samples ever appended, changes whenever the content does
+        self.serial = 0
+
+    def append(self, values):
+        base = self.head * self.series
+        for i in range(self.series):
+            self.data[base + i] = values[i]
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.serial += 1
+
+    def get(self, series, i):
+        # i-th oldest sample
+        row = (self.head - self.count + i) % self.capacity
+        return self.data[row * self.series + series]
+
+history = History(4, HISTORY_SIZE)
+
+class Scheduler:
+    """Named one-shot deadlines, earliest first.
+
+    Setting a name again replaces its deadline, a periodic job sets itself again
+    when it runs. Deadlines are ticks_ms values ordered with ticks_diff, so they
+    stay in order across the ticks wrap-around.
+    """
+
+    def __init__(self):
+        # (deadline, name, job)
+        self.queue = []
+
+    def set(self, name, delay_ms, job):
+        self.cancel(name)
+        deadline = time.ticks_add(time.ticks_ms(), delay_ms)
+        i = len(self.queue)
+        while i and time.ticks_diff(self.queue[i - 1][0], deadline) > 0:
+            i -= 1
+        self.queue.insert(i, (deadline, name, job))
+
+    def cancel(self, name):
+        for i in range(len(self.queue)):
+            if self.queue[i][1] == name:
+                del self.queue[i]
+                return
+
+    def next_ms(self):
+        # time to the earliest deadline, None when nothing is scheduled
+        return max(0, time.ticks_diff(self.queue[0][0], time.ticks_ms())) if self.queue else None
+
+    def run_due(self):
+        """Run the job with the earliest deadline if it has passed, returns True if one ran."""
+        if not self.queue or time.ticks_diff(time.ticks_ms(), self.queue[0][0]) < 0:
+            return False
+        job = self.queue.pop(0)[2]
+        job()
+        return True
+
+scheduler = Scheduler()
+
+class Metrics:
+    """Instrumentation of the fetches and of update_ui().
+
+    The last capacity fetches are kept in a ring buffer, each a tuple in FIELDS
+    order: start ticks, URL, latency ms, body bytes read, HTTP status, exception
+    type name, and free heap before and after. status is None when no response
+    arrived, error is '' when the fetch completed.
+    """
+
+    FIELDS = ('ticks_ms', 'url', 'latency_ms', 'bytes', 'status', 'error', 'heap_before', 'heap_after')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.fetches = [None] * capacity
+        self.head = 0
+        self.count = 0
+        # update_ui() calls, their total and longest duration, and the widget updates they made
+        self.ui_runs = 0
+        self.ui_ms = 0
+        self.ui_max_ms = 0
+        self.ui_updates = 0
+        # heap high-water mark of the samples, heap in use after the last planned collection,
+        # and the planned collections with their longest pause
+        self.heap_peak = 0
+        self.heap_baseline = 0
+        self.collections = 0
+        self.collect_max_ms = 0
+
+    def record_fetch(self, *fetch):
+        self.fetches[self.head] = fetch
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.sample_heap()
+
+    def sample_heap(self):
+        self.heap_peak = max(self.heap_peak, gc.mem_alloc())
+
+    def record_collect(self, ms):
+        self.collections += 1
+        self.collect_max_ms = max(self.collect_max_ms, ms)
+        self.heap_baseline = gc.mem_alloc()
+
+    def record_ui(self, ms, updates):
+        self.ui_runs += 1
+        self.ui_ms += ms
+        self.ui_max_ms = max(self.ui_max_ms, ms)
+        self.ui_updates += updates
+
+    def recent(self):
+        # buffered fetches, oldest first
+        return [self.fetches[(self.head - self.count + i) % self.capacity] for i in range(self.count)]
+
+    def by_url(self):
+        """Summary of the buffered fetches: URL -> [fetches, failures, total ms, longest ms, bytes, last status, last error]."""
+        summary = {}
+        for _, url, ms, size, status, error, _, _ in self.recent():
+            row = summary.setdefault(url, [0, 0, 0, 0, 0, None, ''])
+            row[0] += 1
+            if error or status not in (200, 304):
+                row[1] += 1
+            row[2] += ms
+            row[3] = max(row[3], ms)
+            row[4] += size
+            row[5] = status
+            row[6] = error
+        return summary
+
+    def export(self):
+        return {
+            'fetches': [dict(zip(Metrics.FIELDS, fetch)) for fetch in self.recent()],
+            'update_ui': {'runs': self.ui_runs, 'total_ms': self.ui_ms, 'max_ms': self.ui_max_ms,
+                          'widget_updates': self.ui_updates},
+            'heap': {'free': gc.mem_free(), 'peak': self.heap_peak, 'baseline': self.heap_baseline,
+                     'collections': self.collections, 'collect_max_ms': self.collect_max_ms},
+            'hko_connections': {'handshakes': hko_session.handshakes, 'handshake_ms': hko_session.handshake_ms,
+                                'reused': hko_session.reused, 'saved_ms': hko_session.saved_ms()},
+        }
+
+metrics = Metrics(METRICS_SIZE)
+
+class Snapshot:
+    """Display-ready strings and icon paths of one refresh, never modified once built.
+
+    stations holds (name, temp, temp_min, temp_max, humidity, updtime) rows in stations order,
+    warnings the warning icons, icons the ones rotated in the main icon: the warning icons followed
+    by the weather icon once it is known, forecast (week, icon, temp range, stripe) rows of every
+    forecast day and shelly (temp, humidity, updtime).
+    """
+
+    __slots__ = ('stations', 'warnings', 'icons', 'forecast', 'shelly', 'stale')
+
+    def __init__(self, stations, warnings, icons, forecast, shelly, stale):
+        self.stations = stations
+        self.warnings = warnings
+        self.icons = icons
+        self.forecast = forecast
+        self.shelly = shelly
+        self.stale = stale
+
+def scaled(text, factor=10):
+    try:
+        return int(round(float(text) * factor))
+    except Exception:
+        return History.MISSING
+
 def round_text(text):
     try:
         return "{:.0f}".format(round(float(text))) if text else ""
@@ -159,13 +534,134 @@ def set_status(message, error=False, source=""):
             lbl_status.set_text("{}{}".format(f"({source}) " if source else "", message))
             lbl_status_panel.remove_flag(lv.obj.FLAG.HIDDEN)
 
-def csv_get_value(csv, key):
-    lines = csv.split('\n')
-    for line in lines:
-        if line:
-            fields = line.split(',')
-            if fields[1] == key:
-                return fields
+def preallocate_buffers():
+    # allocated while the heap is not fragmented yet, fetches only take them from the pools
+    while len(read_buffers) < MAX_CONCURRENT_FETCHES:
+        read_buffers.append(bytearray(READ_CHUNK_SIZE + CSV_LINE_SIZE))
+    if deflate:
+        while len(inflate_inputs) < MAX_CONCURRENT_FETCHES:
+            inflate_inputs.append(InflateInput())
+
+def acquire_read_buffer():
+    return read_buffers.pop() if read_buffers else bytearray(READ_CHUNK_SIZE + CSV_LINE_SIZE)
+
+def release_read_buffer(buf):
+    read_buffers.append(buf)
+
+def collect_garbage():
+    """Planned collection once a fetch is published, before the screen is redrawn.
+
+    The fetch leaves the most garbage behind, collecting it here keeps the heap
+    from filling up and forcing a collection in the middle of an LVGL animation.
+    """
+    metrics.sample_heap()
+    start = time.ticks_ms()
+    gc.collect()
+    metrics.record_collect(time.ticks_diff(time.ticks_ms(), start))
+
+async def stream_readinto(stream, buf):
+    # streams without readinto() are read and copied
+    if hasattr(stream, 'readinto'):
+        n = await stream.readinto(buf)
+    else:
+        data = await stream.read(len(buf))
+        n = len(data)
+        buf[:n] = data
+    return n or 0
+
+async def read_into(resp, buf):
+    """Read the next piece of the response body into buf, returns the byte count (0 at the end)."""
+    n = await stream_readinto(resp.raw, buf)
+    resp.received += n
+    return n
+
+async def read_text(resp):
+    """Whole body of a short response, decoded from the pooled buffer it is read into."""
+    buf = acquire_read_buffer()
+    mv = memoryview(buf)
+    filled = 0
+    try:
+        while True:
+            if filled == len(buf):
+                raise ValueError("Response longer than {} bytes".format(len(buf)))
+            n = await read_into(resp, mv[filled:])
+            if not n:
+                break
+            filled += n
+        return str(mv[:filled], 'utf-8')
+    finally:
+        release_read_buffer(buf)
+
+def csv_kpi_values(fields, kpi_pos, time_pos):
+    if type(kpi_pos) is list:
+        kpi = []
+        for pos in kpi_pos:
+            if pos < len(fields):
+                if fields[pos] is None:
+                    raise Exception("Empty data in CSV")
+                kpi += fields[pos],
+            else:
+                kpi += '',
+    else:
+        if fields[kpi_pos] is None:
+            raise Exception("Empty data in CSV")
+        kpi = fields[kpi_pos]
+    return kpi, format_hko_date(fields[time_pos])
+
+def csv_index_line(index, data, start, end, kpi_pos, time_pos):
+    if end > start and data[end - 1] == 13:
+        end -= 1
+    fields = data[start:end].decode().split(',')
+    # skip the header and blank lines, station rows start with the time
+    if len(fields) > 2 and fields[time_pos][:1].isdigit():
+        index[fields[1]] = csv_kpi_values(fields, kpi_pos, time_pos)
+
+async def parse_station_index(resp, kpi_pos, time_pos):
+    """Scan the CSV body chunk by chunk and index the readings of every station.
+
+    Returns a dict of station -> (kpi, kpi_time). The body goes through a pooled
+    buffer of READ_CHUNK_SIZE + CSV_LINE_SIZE bytes, so memory does not grow with
+    the file. Lines longer than CSV_LINE_SIZE cannot be a station row and are skipped.
+    """
+    index = {}
+    buf = acquire_read_buffer()
+    mv = memoryview(buf)
+    filled = 0
+    skipping = False
+    try:
+        while True:
+            n = await read_into(resp, mv[filled:filled + READ_CHUNK_SIZE])
+            if not n:
+                if filled and not skipping:
+                    csv_index_line(index, bytes(mv[:filled]), 0, filled, kpi_pos, time_pos)
+                return index
+
+            filled += n
+            data = bytes(mv[:filled])
+            start = 0
+            if skipping:
+                start = data.find(b'\n') + 1
+                if not start:
+                    filled = 0
+                    continue
+                skipping = False
+
+            while True:
+                end = data.find(b'\n', start)
+                if end < 0:
+                    break
+                csv_index_line(index, data, start, end, kpi_pos, time_pos)
+                start = end + 1
+
+            # keep the incomplete line at the head of the buffer
+            filled -= start
+            if filled > CSV_LINE_SIZE:
+                skipping = True
+                filled = 0
+            elif filled:
+                mv[:filled] = memoryview(data)[start:]
+    finally:
+        release_read_buffer(buf)
 
 def get_hko_proper_time(time):
     return time.replace('T', ' ').replace('+08:00', '')
@@ -174,26 +670,48 @@ async def get_weather_icon():
     icon = ''
     icon_time = ''
 
-    data = await get_hko_weather_json(api_url['weather'])
+    data = await get_hko_weather_json(api_url['weather'], json_paths['weather'])
     if data and 'icon' in data:
         icon = data['icon'][0]
         icon_time = get_hko_proper_time(data['iconUpdateTime'])
 
     return icon, icon_time
 
+async def get_current_weather():
+    """Get the weather icon and the readings of every station in the current weather report.
+
+    Returns (icon, icon_time, record_time, readings), readings being
+    dataset -> {station: (kpi, kpi_time)} like the regional CSV indexes.
+    """
+    icon = ''
+    icon_time = ''
+    record_time = ''
+    readings = {}
+
+    data = await get_hko_weather_json(api_url['weather'], json_paths['current'], 'current')
+    if data:
+        if 'icon' in data:
+            icon = data['icon'][0]
+            icon_time = get_hko_proper_time(data['iconUpdateTime'])
+        for name in ('temperature', 'humidity'):
+            if name in data:
+                kpi_time = get_hko_proper_time(data[name].get('recordTime', ''))
+                record_time = record_time or kpi_time
+                readings[name] = {RHRREAD_PLACES.get(place['place'], place['place']): (str(place['value']), kpi_time)
+                                  for place in data[name].get('data', ()) if 'place' in place and 'value' in place}
+
+    return icon, icon_time, record_time, readings
+
 async def get_forecast_data():
     weather_data = None
     weather_time = ''
 
-    fields = ['forecastDate', 'week', 'forecastMaxtemp', 'forecastMintemp', 'forecastMaxrh', 'forecastMinrh',
-              'ForecastIcon']
-
-    data = await get_hko_weather_json(api_url['forecast'])
+    data = await get_hko_weather_json(api_url['forecast'], json_paths['forecast'])
     if data and all(k in data for k in ('weatherForecast','updateTime')):
         weather_data = []
         for day in range(MAX_HKO_FORECAST_DAYS):
             weather_data.append({})
-            for field in fields:
+            for field in FORECAST_FIELDS:
                 weather_data[day][field] = data['weatherForecast'][day].get(field, '')
         weather_time = get_hko_proper_time(data['updateTime'])
 
@@ -201,7 +719,7 @@ async def get_forecast_data():
 
 async def get_warning_data():
     icons = []
-    data = await get_hko_weather_json(api_url['warnings'])
+    data = await get_hko_weather_json(api_url['warnings'], json_paths['warnings'])
     if 'details' in data:
         for warning in data['details']:
             icon_name = ''
@@ -213,235 +731,1292 @@ async def get_warning_data():
 
     return icons
 
-async def get_hko_weather_json(url):
-    data = None
+async def get_warning_summary():
+    try:
+        return await cached_get(api_url['warnsum'], parse_digest)
+    except Exception as e:
+        raise Exception("URL:{} - {}".format(api_url['warnsum'], e))
+
+# JsonExtractor path match results
+JSON_SKIP = 0
+JSON_DESCEND = 1
+JSON_KEEP = 2
+
+# byte values ending a number/true/false/null and separators between tokens
+JSON_LITERAL_END = (44, 125, 93, 32, 9, 13, 10)
+JSON_SEPARATORS = (58, 32, 9, 13, 10)
+
+class JsonExtractor:
+    """Incremental JSON parser that only builds the values on whitelisted paths.
 
-    if net.connected():
-        resp = None
+    Paths are dotted member names where '*' matches any array index or object
+    key, e.g. 'weatherForecast.*.week'. A value on a whitelisted path is kept
+    whole, objects and arrays leading to one are rebuilt with the kept members
+    only, and everything else (including long strings) is skipped as the bytes
+    are fed in.
+    """
+
+    def __init__(self, paths):
+        self.paths = [tuple(path.split('.')) for path in paths]
+        self.result = None
+        # open containers: [container or None, path, match, key or next index, is object]
+        self._stack = []
+        self._done = False
+        self._tok = None
+        self._tok_esc = False
+        self._in_str = False
+        self._in_lit = False
+        self._esc = False
+        self._is_key = False
+        self._want_key = False
+        self._match_val = JSON_SKIP
+
+    def _match(self, path):
+        match = JSON_SKIP
+        depth = len(path)
+        for pattern in self.paths:
+            if len(pattern) < depth:
+                continue
+            for i in range(depth):
+                if pattern[i] != '*' and pattern[i] != path[i]:
+                    break
+            else:
+                if len(pattern) == depth:
+                    return JSON_KEEP
+                match = JSON_DESCEND
+        return match
+
+    def _begin_value(self):
+        # work out whether the value starting here is needed, returns (path, match)
+        if not self._stack:
+            return (), JSON_DESCEND
+        frame = self._stack[-1]
+        key = frame[3]
+        if not frame[4]:
+            frame[3] += 1
+        if frame[2] != JSON_DESCEND:
+            return None, frame[2]
+        path = frame[1] + (key if frame[4] else str(key),)
+        return path, self._match(path)
+
+    def _put(self, value):
+        if self._stack:
+            frame = self._stack[-1]
+            if frame[4]:
+                frame[0][frame[3]] = value
+            else:
+                frame[0].append(value)
+        else:
+            self.result = value
+            self._done = True
+
+    def _end_token(self):
+        tok = self._tok
+        self._tok = None
+        if self._in_str:
+            self._in_str = False
+            if tok is None:
+                return
+            value = json.loads('"' + tok.decode() + '"') if self._tok_esc else tok.decode()
+            if self._is_key:
+                self._stack[-1][3] = value
+                return
+        else:
+            self._in_lit = False
+            if tok is None:
+                return
+            value = json.loads(tok)
+        self._put(value)
+
+    def feed(self, data):
+        i = 0
+        n = len(data)
+        while i < n:
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                    if self._tok is not None:
+                        self._tok.append(data[i])
+                    i += 1
+                    continue
+                quote = data.find(b'"', i)
+                backslash = data.find(b'\\', i, quote if quote >= 0 else n)
+                if backslash >= 0:
+                    if self._tok is not None:
+                        self._tok.extend(data[i:backslash + 1])
+                        self._tok_esc = True
+                    self._esc = True
+                    i = backslash + 1
+                elif quote < 0:
+                    if self._tok is not None:
+                        self._tok.extend(data[i:])
+                    i = n
+                else:
+                    if self._tok is not None:
+                        self._tok.extend(data[i:quote])
+                    i = quote + 1
+                    self._end_token()
+                continue
+
+            c = data[i]
+            if self._in_lit:
+                if c in JSON_LITERAL_END:
+                    self._end_token()
+                    continue
+                if self._tok is not None:
+                    self._tok.append(c)
+            elif c == 34:  # '"'
+                self._in_str = True
+                self._tok_esc = False
+                if self._want_key:
+                    self._want_key = False
+                    self._is_key = True
+                    keep = self._stack[-1][2]
+                else:
+                    self._is_key = False
+                    keep = self._begin_value()[1]
+                self._tok = bytearray() if keep else None
+            elif c == 123 or c == 91:  # '{' or '['
+                path, keep = self._begin_value()
+                container = None
+                if keep:
+                    container = {} if c == 123 else []
+                    self._put(container)
+                    self._done = False
+                self._stack.append([container, path, keep, None if c == 123 else 0, c == 123])
+                self._want_key = c == 123
+            elif c == 125 or c == 93:  # '}' or ']'
+                self._stack.pop()
+                self._want_key = False
+                if not self._stack:
+                    self._done = True
+            elif c == 44:  # ','
+                self._want_key = self._stack[-1][4]
+            elif c not in JSON_SEPARATORS:
+                self._in_lit = True
+                self._tok = bytearray((c,)) if self._begin_value()[1] else None
+            i += 1
+
+    def close(self):
+        if self._in_lit:
+            self._end_token()
+        if not self._done:
+            raise ValueError("Incomplete JSON")
+        return self.result
+
+def get_header(resp, name):
+    headers = getattr(resp, 'headers', None) or {}
+    for key in headers:
+        if key.lower() == name:
+            return headers[key]
+    return None
+
+class HttpConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.ticks_ms()
+        # response whose body is still to be read off the connection
+        self.pending = None
+
+    def close(self):
         try:
-            resp = await arequests.get(url, timeout=NETWORK_TIMEOUT)
-            if resp.status_code == 200:
-                data = await resp.json()
-        except Exception as e:
-            raise Exception("URL:{} - {}".format(url, e))
-        finally:
-            if resp:
-                resp.close()
+            self.writer.close()
+        except Exception:
+            pass
+
+class HttpResponse:
+    """Response on a keep-alive connection, the body is read through raw.read(n)."""
+
+    def __init__(self, session, conn, status_code, headers):
+        self.session = session
+        self.conn = conn
+        self.status_code = status_code
+        self.headers = headers
+        self.raw = self
+        self._reader = conn.reader
+        self._chunked = (get_header(self, 'transfer-encoding') or '').lower() == 'chunked'
+        length = get_header(self, 'content-length')
+        if status_code in (204, 304) or status_code < 200:
+            self._chunked = False
+            self._left = 0
+        elif self._chunked:
+            self._left = 0
+        else:
+            # without a length the body runs until the server closes the connection
+            self._left = int(length) if length is not None else None
+        self._eof = self._left == 0 and not self._chunked
+        self._reusable = self._left is not None and (get_header(self, 'connection') or '').lower() != 'close'
+
+    async def _available(self, n):
+        # no of bytes up to n that can be read now, 0 at the end of the body
+        if self._eof:
+            return 0
+
+        reader = self._reader
+        if self._chunked and not self._left:
+            size = int((await reader.readline()).decode().split(';')[0].strip(), 16)
+            if not size:
+                # skip the trailer
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                self._eof = True
+                return 0
+            self._left = size
+        return n if self._left is None else min(n, self._left)
+
+    async def _consumed(self, n):
+        if self._left is None:
+            self._eof = not n
+            return
+        if not n:
+            raise OSError("Connection closed in response body")
+
+        self._left -= n
+        if not self._left:
+            if self._chunked:
+                await self._reader.readline()
+            else:
+                self._eof = True
+
+    async def read(self, n):
+        n = await self._available(n)
+        if not n:
+            return b''
+        data = await self._reader.read(n)
+        await self._consumed(len(data))
+        return data
+
+    async def readinto(self, buf):
+        """Read the next piece of the body into buf, returns the byte count (0 at the end)."""
+        n = await self._available(len(buf))
+        if not n:
+            return 0
+        if hasattr(self._reader, 'readinto'):
+            # MicroPython streams read into the buffer itself
+            got = await self._reader.readinto(memoryview(buf)[:n])
+        else:
+            data = await self._reader.read(n)
+            got = len(data)
+            buf[:got] = data
+        await self._consumed(got)
+        return got
+
+    async def drain(self):
+        while await self.read(READ_CHUNK_SIZE):
+            pass
+
+    def close(self):
+        conn = self.conn
+        if conn is None:
+            return
+        self.conn = None
+
+        if not self._reusable or (not self._eof and (self._chunked or self._left > HTTP_DRAIN_LIMIT)):
+            conn.close()
+            return
+        if not self._eof:
+            # the rest of the body is skipped when the connection is next used
+            conn.pending = self
+        self.session.release(conn)
+
+class HttpSession:
+    """Pool of keep-alive HTTP/1.1 connections to one host.
+
+    Connections are reused across the requests of a refresh cycle, dropped after
+    HTTP_IDLE_TIMEOUT_MS without use, and a request that fails on a reused
+    connection is retried on a new one. handshakes and handshake_ms count the
+    connections opened and the time spent opening them, reused the requests
+    that needed no new connection.
+    """
+
+    def __init__(self, host, port=443, ssl=True):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.idle = []
+        self.handshakes = 0
+        self.handshake_ms = 0
+        self.reused = 0
+
+    def saved_ms(self):
+        # estimated connection setup time saved by reusing connections
+        return self.reused * self.handshake_ms // self.handshakes if self.handshakes else 0
+
+    async def connect(self):
+        start = time.ticks_ms()
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        self.handshakes += 1
+        self.handshake_ms += time.ticks_diff(time.ticks_ms(), start)
+        return HttpConnection(reader, writer)
+
+    async def acquire(self):
+        # most recently used live connection first, returns (connection, reused)
+        now = time.ticks_ms()
+        while self.idle:
+            conn = self.idle.pop()
+            if time.ticks_diff(now, conn.last_used) > HTTP_IDLE_TIMEOUT_MS:
+                conn.close()
+                continue
+            if conn.pending:
+                try:
+                    await conn.pending.drain()
+                except Exception:
+                    conn.close()
+                    continue
+                conn.pending = None
+            return conn, True
+        return await self.connect(), False
+
+    def release(self, conn):
+        conn.last_used = time.ticks_ms()
+        if len(self.idle) < HTTP_POOL_SIZE:
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+    async def get(self, path, headers=None):
+        request = "GET {} HTTP/1.1\r\nHost: {}\r\n".format(path, self.host)
+        for key in headers or {}:
+            request += "{}: {}\r\n".format(key, headers[key])
+        request = (request + "\r\n").encode()
+
+        while True:
+            conn, reused = await self.acquire()
+            try:
+                conn.writer.write(request)
+                await conn.writer.drain()
+                line = await conn.reader.readline()
+                if not line:
+                    raise OSError("Connection closed by server")
+            except Exception:
+                conn.close()
+                if reused:
+                    # the server dropped the kept-alive connection, try again on another one
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        try:
+            status_code = int(line.split()[1])
+            resp_headers = {}
+            while True:
+                line = await conn.reader.readline()
+                if not line:
+                    raise OSError("Connection closed in response headers")
+                if line in (b'\r\n', b'\n'):
+                    break
+                key, value = line.decode().split(':', 1)
+                resp_headers[key.strip()] = value.strip()
+        except BaseException:
+            conn.close()
+            raise
+
+        if reused:
+            self.reused += 1
+        return HttpResponse(self, conn, status_code, resp_headers)
+
+hko_session = HttpSession(HKO_HOST)
+
+class InflateInput(io.IOBase):
+    """Compressed bytes waiting for the decompressor, which reads them synchronously."""
+
+    def __init__(self):
+        self.buf = bytearray(INFLATE_INPUT_SIZE)
+        self.mv = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+
+    def readinto(self, buf):
+        n = min(len(buf), self.end - self.start)
+        buf[:n] = self.mv[self.start:self.start + n]
+        self.start += n
+        return n
+
+class InflateReader:
+    """Decompressed view of a gzip or deflate response body, used as the response raw stream.
+
+    The compressed body is read from source into an InflateInput of INFLATE_INPUT_SIZE
+    bytes that the decompressor consumes, so neither the compressed nor the decompressed
+    body is ever held as a whole. The input is topped up before every read as the
+    decompressor cannot wait for the network itself.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.source_eof = False
+        self.input = inflate_inputs.pop() if inflate_inputs else InflateInput()
+        self.input.start = self.input.end = 0
+        self.stream = deflate.DeflateIO(self.input, deflate.AUTO, INFLATE_WBITS)
+
+    async def fill(self):
+        pending = self.input
+        if pending.start:
+            pending.buf[:pending.end - pending.start] = pending.buf[pending.start:pending.end]
+            pending.end -= pending.start
+            pending.start = 0
+        while not self.source_eof and pending.end < len(pending.buf):
+            end = min(pending.end + READ_CHUNK_SIZE, len(pending.buf))
+            n = await stream_readinto(self.source, pending.mv[pending.end:end])
+            if not n:
+                self.source_eof = True
+                break
+            pending.end += n
+
+    async def read(self, n):
+        await self.fill()
+        return self.stream.read(n)
+
+    async def readinto(self, buf):
+        await self.fill()
+        return self.stream.readinto(buf)
+
+    def close(self):
+        # the input buffer goes back to the pool, the decompressor and its window are dropped
+        if self.input:
+            inflate_inputs.append(self.input)
+            self.input = None
+            self.stream = None
+
+def accept_encoding(headers):
+    # ask for a compressed body when it can be decompressed
+    if deflate:
+        headers['Accept-Encoding'] = 'gzip, deflate'
+    return headers
+
+def decode_response(resp):
+    """Route the body of a compressed response through an InflateReader, returns resp."""
+    encoding = (get_header(resp, 'content-encoding') or '').lower()
+    if encoding in ('gzip', 'deflate'):
+        if not deflate:
+            resp.close()
+            raise ValueError("Unsupported content encoding {}".format(encoding))
+        resp.raw = InflateReader(resp.raw)
+    return resp
+
+def close_response(resp):
+    if isinstance(resp.raw, InflateReader):
+        resp.raw.close()
+    resp.close()
+
+async def http_get(url, headers=None):
+    # offline is a failed fetch, the dataset keeps its last data and is retried
+    if not net.connected():
+        raise OSError("Network not connected")
+    headers = accept_encoding(dict(headers or {}))
+    # requests to the HKO host share the keep-alive session
+    prefix = 'https://' + HKO_HOST
+    if url.startswith(prefix + '/'):
+        resp = decode_response(await hko_session.get(url[len(prefix):], headers))
+    else:
+        resp = decode_response(await arequests.get(url, headers=headers, timeout=NETWORK_TIMEOUT))
+    # body bytes read so far, counted by read_into()
+    resp.received = 0
+    return resp
+
+def record_fetch(url, start, heap_before, resp, error):
+    metrics.record_fetch(start, url, time.ticks_diff(time.ticks_ms(), start),
+                         resp.received if resp else 0, resp.status_code if resp else None,
+                         type(error).__name__ if error else '', heap_before, gc.mem_free())
+
+async def cached_get(url, parse, args=(), variant=None):
+    """GET url and return the result of parse(resp, *args).
+
+    Validators of the last 200 response are sent back as If-None-Match /
+    If-Modified-Since, and on 304 the result parsed from that response is
+    reused without reading a body. variant names any other input the parsed
+    result depends on (e.g. the station); a different variant skips the cache.
+    """
+    entry = http_cache.get(url)
+    if entry and entry[2] != variant:
+        entry = None
+
+    headers = {}
+    if entry:
+        if entry[0]:
+            headers['If-None-Match'] = entry[0]
+        if entry[1]:
+            headers['If-Modified-Since'] = entry[1]
+
+    data = None
+    resp = None
+    error = None
+    start = time.ticks_ms()
+    heap_before = gc.mem_free()
+    try:
+        resp = await http_get(url, headers)
+        if resp.status_code == 304 and entry:
+            data = entry[3]
+        elif resp.status_code == 200:
+            data = await parse(resp, *args)
+            etag = get_header(resp, 'etag')
+            last_modified = get_header(resp, 'last-modified')
+            if etag or last_modified:
+                http_cache[url] = (etag, last_modified, variant, data)
+            elif url in http_cache:
+                del http_cache[url]
+        else:
+            raise OSError("HTTP status {}".format(resp.status_code))
+    except BaseException as e:
+        # a fetch cut short by its deadline is recorded as cancelled
+        error = e
+        raise
+    finally:
+        if resp:
+            close_response(resp)
+        record_fetch(url, start, heap_before, resp, error)
 
     return data
 
-async def get_hko_location_csv_values(url, kpi_pos, time_pos):
-    kpi = None
-    kpi_time = None
+async def parse_json_fields(resp, paths):
+    extractor = JsonExtractor(paths)
+    buf = acquire_read_buffer()
+    mv = memoryview(buf)
+    try:
+        while True:
+            n = await read_into(resp, mv[:READ_CHUNK_SIZE])
+            if not n:
+                break
+            extractor.feed(bytes(mv[:n]))
+    finally:
+        release_read_buffer(buf)
+
+    return extractor.close()
+
+async def parse_digest(resp):
+    # SHA-256 of the body, hashed chunk by chunk
+    digest = hashlib.sha256()
+    buf = acquire_read_buffer()
+    mv = memoryview(buf)
+    try:
+        while True:
+            n = await read_into(resp, mv[:READ_CHUNK_SIZE])
+            if not n:
+                break
+            digest.update(mv[:n])
+    finally:
+        release_read_buffer(buf)
+
+    return digest.digest()
 
-    if net.connected():
-        resp = None
-        try:
-            resp = await arequests.get(url, timeout=NETWORK_TIMEOUT)
-            if resp.status_code == 200:
-                fields = csv_get_value(await resp.text, station)
-                if fields:
-                    if type(kpi_pos) is list:
-                        kpi = []
-                        for pos in kpi_pos:
-                            if pos < len(fields):
-                                if fields[pos] is None:
-                                    raise Exception("Empty data in CSV")
-                                kpi += fields[pos],
-                            else:
-                                kpi += '',
-                    else:
-                        if fields[kpi_pos] is None:
-                            raise Exception("Empty data in CSV")
-                        kpi = fields[kpi_pos]
-                    kpi_time = format_hko_date(fields[time_pos])
-        except Exception as e:
-            raise Exception("URL:{} - {}".format(url, e))
-        finally:
-            if resp:
-                resp.close()
-    return kpi, kpi_time
+async def get_hko_weather_json(url, paths, variant=None):
+    try:
+        return await cached_get(url, parse_json_fields, (paths,), variant)
+    except Exception as e:
+        raise Exception("URL:{} - {}".format(url, e))
+
+async def get_hko_station_index(url, kpi_pos, time_pos):
+    try:
+        return await cached_get(url, parse_station_index, (kpi_pos, time_pos))
+    except Exception as e:
+        raise Exception("URL:{} - {}".format(url, e))
+
+async def parse_shelly(resp):
+    return (await read_text(resp)).split(',')
 
 async def get_shelly_data():
-    data = None
+    try:
+        return await cached_get(shelly_url, parse_shelly)
+    except Exception as e:
+        raise Exception("URL:{} - {}".format(shelly_url, e))
+
+def hko_time_to_seconds(text):
+    # 'YYYY-MM-DD HH:MM:SS' HKT, the device clock is expected to run on local time
+    return time.mktime((int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                        int(text[11:13]), int(text[14:16]), int(text[17:19]), 0, 0))
 
-    if net.connected():
-        resp = None
+def published_time(name):
+    return {
+        'temperature': temp_updtime,
+        'humidity': humidity_updtime,
+        'temperature_maxmin': temp_maxmin_updtime,
+        'weather': icon_updtime,
+        'current': current_updtime,
+        'forecast': forecast_updtime,
+    }.get(name)
+
+def next_refresh_delay_ms(name, published, unchanged=0):
+    cadence, lag, longest = REFRESH_SCHEDULE[name]
+    delay = longest
+    if published and cadence:
         try:
-            resp = await arequests.get(shelly_url, timeout=NETWORK_TIMEOUT)
-            if resp.status_code == 200:
-                data = str(await resp.text).split(',')
-        except Exception as e:
-            raise Exception("URL:{} - {}".format(shelly_url, e))
-        finally:
-            if resp:
-                resp.close()
-    return data
+            delay = hko_time_to_seconds(published) + cadence + lag - time.time()
+        except Exception:
+            pass
+    delay = min(max(delay, MIN_REFRESH_DELAY) * (1 << unchanged), longest) + random.randint(0, REFRESH_JITTER)
+    return int(delay * 1000)
+
+def schedule_refresh(names):
+    now = time.ticks_ms()
+    for name in names:
+        published = published_time(name)
+        # an update HKO is late with, or a time that only moves on a change (e.g. iconUpdateTime)
+        if published and published == last_published.get(name):
+            unchanged_fetches[name] = min(unchanged_fetches.get(name, 0) + 1, 8)
+        else:
+            unchanged_fetches[name] = 0
+        last_published[name] = published
+        next_refresh_ticks_ms[name] = time.ticks_add(now, next_refresh_delay_ms(name, published, unchanged_fetches[name]))
+    schedule_retrieval()
+
+def request_refresh(names=None):
+    # make the datasets (all by default) due on the next tick, except those waiting for a breaker probe
+    for name in names or REFRESH_SCHEDULE:
+        if not breaker_open(name):
+            next_refresh_ticks_ms[name] = None
+    schedule_retrieval()
+
+def breaker_open(name):
+    return fetch_failures.get(name, 0) >= BREAKER_THRESHOLD
+
+def retry_delay_ms(failures):
+    if failures >= BREAKER_THRESHOLD:
+        delay = BREAKER_PROBE_DELAY
+    else:
+        delay = RETRY_BASE_DELAY << (failures - 1)
+    return (delay + random.randint(0, REFRESH_JITTER)) * 1000
+
+def schedule_retry(name, rescheduled=True):
+    """Count a failure of dataset name and, if rescheduled, back off its next fetch."""
+    failures = fetch_failures.get(name, 0) + 1
+    if not net.connected():
+        # the endpoint is not to blame, the breaker stays closed for when the network is back
+        failures = min(failures, BREAKER_THRESHOLD - 1)
+    fetch_failures[name] = failures
+    if rescheduled or failures >= BREAKER_THRESHOLD:
+        next_refresh_ticks_ms[name] = time.ticks_add(time.ticks_ms(), retry_delay_ms(failures))
+
+def dataset_needed(name):
+    """Return False for a dataset the current settings do not use."""
+    if name == 'shelly':
+        return enable_shelly
+    if data_source == DATA_SOURCE_RHRREAD:
+        if name == 'weather':
+            return False
+        if name in ('temperature', 'humidity'):
+            # the regional CSVs stand in for the current weather report until it is retrieved,
+            # while it fails, and for the stations it misses
+            if 'current' in fetch_failures or name not in rhrread_places:
+                return True
+            return any(s not in rhrread_places[name] for s in stations)
+    elif name == 'current':
+        return False
+    return True
 
-async def retrieve_data():
-    global temp, temp_updtime, temp_maxmin, temp_maxmin_updtime, humidity, humidity_updtime
-    global forecast_data, forecast_updtime, weather_icons
-    global last_refresh_ticks_ms
-    global pending_retrieval
+def refresh_due(name, now):
+    if not dataset_needed(name):
+        return False
+    due = next_refresh_ticks_ms.get(name)
+    return due is None or time.ticks_diff(now, due) >= 0
+
+def any_refresh_due():
+    now = time.ticks_ms()
+    for name in REFRESH_SCHEDULE:
+        if refresh_due(name, now):
+            return True
+    return False
+
+def schedule_retrieval():
+    """Set the 'refresh' deadline to when the first dataset in use becomes due."""
+    now = time.ticks_ms()
+    delay = None
+    for name in REFRESH_SCHEDULE:
+        if dataset_needed(name):
+            due = next_refresh_ticks_ms.get(name)
+            wait = 0 if due is None else max(0, time.ticks_diff(due, now))
+            delay = wait if delay is None else min(delay, wait)
+    if delay is None:
+        scheduler.cancel('refresh')
+    else:
+        scheduler.set('refresh', delay, retrieve_due_data)
+
+def retrieve_due_data():
+    # a fetch still running or publishing sets the next deadline when it is published
+    if retrieval_state == RETRIEVAL_IDLE and any_refresh_due():
+        set_status("Retrieving network data...")
+        start_retrieval()
+
+def save_data(throttled=False):
+    """Write the current dataset to DATA_FILE, one JSON value per line in PERSISTED_FIELDS order.
+
+    The file is written to a temporary name and renamed over the previous one,
+    and nothing is written when the values are unchanged since the last save,
+    or if throttled, when the last write was less than SAVE_INTERVAL_MS ago.
+    """
+    global saved_data, last_save_ticks_ms
+
+    g = globals()
+    values = tuple(g[name] for name in PERSISTED_FIELDS)
+    if values == saved_data:
+        return
+    now = time.ticks_ms()
+    if throttled and last_save_ticks_ms is not None and time.ticks_diff(now, last_save_ticks_ms) < SAVE_INTERVAL_MS:
+        return
+    last_save_ticks_ms = now
+
+    tmp_file = DATA_FILE + '.tmp'
+    try:
+        with open(tmp_file, 'w') as f:
+            f.write(DATA_FILE_VERSION + '\n')
+            for value in values:
+                f.write(json.dumps(value) + '\n')
+        try:
+            os.rename(tmp_file, DATA_FILE)
+        except OSError:
+            # the file system does not replace on rename
+            os.remove(DATA_FILE)
+            os.rename(tmp_file, DATA_FILE)
+        saved_data = values
+    except Exception:
+        pass
+
+def load_data():
+    global saved_data, data_stale
+
+    try:
+        with open(DATA_FILE) as f:
+            if f.readline().strip() != DATA_FILE_VERSION:
+                return False
+            values = tuple(json.loads(f.readline()) for _ in PERSISTED_FIELDS)
+    except Exception:
+        return False
+
+    g = globals()
+    for name, value in zip(PERSISTED_FIELDS, values):
+        g[name] = value
+    data_stale = True
+    try:
+        snap = build_snapshot()
+    except Exception:
+        return False
+
+    saved_data = values
+    publish_snapshot(snap)
+    return True
+
+async def fetch_concurrently(jobs, results=None):
+    """Run (name, function, args) jobs with at most MAX_CONCURRENT_FETCHES in flight.
+
+    Each job is bounded by its FETCH_DEADLINES entry, or BREAKER_PROBE_DEADLINE
+    while its circuit breaker is open, and the whole batch by REFRESH_DEADLINE.
+    The result of each job, or the exception it ended with, is stored as
+    results[name] as soon as the job finishes. Returns results.
+    """
+    if results is None:
+        results = {}
+    finished = set()
+    queue = list(jobs)
+
+    async def worker():
+        while queue:
+            name, func, args = queue.pop(0)
+            deadline = FETCH_DEADLINES.get(name, NETWORK_TIMEOUT)
+            if breaker_open(name):
+                deadline = min(deadline, BREAKER_PROBE_DEADLINE)
+            try:
+                results[name] = await asyncio.wait_for(func(*args), deadline)
+            except asyncio.TimeoutError:
+                results[name] = Exception("{} - no response in {}s".format(name, deadline))
+            except Exception as e:
+                results[name] = e
+            finished.add(name)
+
+    workers = [worker() for _ in range(min(MAX_CONCURRENT_FETCHES, len(queue)))]
+    try:
+        await asyncio.wait_for(asyncio.gather(*workers), REFRESH_DEADLINE)
+    except asyncio.TimeoutError:
+        pass
+
+    # results may already have been taken for publishing, finished tells which jobs ended in time
+    for name, _, _ in jobs:
+        if name not in finished:
+            results[name] = Exception("{} - refresh deadline {}s exceeded".format(name, REFRESH_DEADLINE))
+
+    return results
+
+def select_station(name):
+    """Show the readings of station name from station_index, returns False if nothing is indexed yet."""
+    global station, temp, temp_updtime, humidity, humidity_updtime, temp_maxmin, temp_maxmin_updtime
+
+    if not station_index:
+        if name != station:
+            # the warm start readings belong to the saved station, not to this one
+            temp = temp_updtime = humidity = humidity_updtime = temp_maxmin = temp_maxmin_updtime = None
+        station = name
+        return False
+
+    station = name
+
+    temp, temp_updtime = station_index.get('temperature', {}).get(name, (None, None))
+    humidity, humidity_updtime = station_index.get('humidity', {}).get(name, (None, None))
+    temp_maxmin, temp_maxmin_updtime = station_index.get('temperature_maxmin', {}).get(name, (None, None))
+    return True
+
+def station_reading(dataset, name):
+    return station_index.get(dataset, {}).get(name, (None, None))[0]
+
+def station_row(name):
+    # the primary station may only be known from the warm start data, the others from station_index
+    if name == station:
+        kpi, kpi_time, rh, maxmin = temp, temp_updtime, humidity, temp_maxmin
+    else:
+        kpi, kpi_time = station_index.get('temperature', {}).get(name, (None, None))
+        rh = station_reading('humidity', name)
+        maxmin = station_reading('temperature_maxmin', name)
+    return (name, round_text(kpi),
+            round_text(maxmin[1]) if maxmin else None,
+            round_text(maxmin[0]) if maxmin else None,
+            "{}".format(rh) if rh is not None else "",
+            (kpi_time or "")[-8:])
+
+def build_snapshot():
+    """Format the current data into a new Snapshot."""
+    forecast = []
+    for day in (forecast_data or [])[:MAX_HKO_FORECAST_DAYS]:
+        if 'week' in day:
+            forecast.append((day['week'][0:3],
+                             'A:apps/{}/resources/pic{}.png'.format(NAME, day['ForecastIcon']),
+                             "{}-{}".format(day['forecastMintemp']['value'], day['forecastMaxtemp']['value']),
+                             0x1e5eb3 if len(forecast) % 2 == 0 else 0x277beb))
+
+    warnings = tuple(warning_icons)
+    # no weather icon before the current weather is first retrieved
+    icons = warnings + (f'A:apps/{NAME}/resources/pic{icon_idx}.png',) if icon_idx is not None else warnings
+    return Snapshot(tuple(station_row(name) for name in (stations or [station])),
+                    warnings,
+                    icons,
+                    tuple(forecast),
+                    (round_text(shelly_tc), round_text(shelly_rh), shelly_updtime or ""),
+                    data_stale)
+
+def publish_snapshot(snap):
+    """Make snap the data shown, the UI only ever sees whole snapshots."""
+    global snapshot
+    global current_icon, current_station
     global pending_refresh_ui
-    global shelly_tc, shelly_rh, shelly_updtime
-    global current_icon
 
-    pending_retrieval = False
+    if snapshot is None or len(snapshot.icons) != len(snap.icons):
+        current_icon = 0
+    if current_station >= len(snap.stations):
+        current_station = 0
+    snapshot = snap
+    pending_refresh_ui = True
+
+def record_history():
+    global last_history_ticks_ms
+
+    now = time.ticks_ms()
+    if last_history_ticks_ms is not None and time.ticks_diff(now, last_history_ticks_ms) < HISTORY_INTERVAL_MS:
+        return
+    last_history_ticks_ms = now
+
+    # the readings globals always follow the primary station
+    history.append((
+        scaled(temp),
+        scaled(humidity),
+        scaled(shelly_tc) if enable_shelly else History.MISSING,
+        scaled(shelly_rh) if enable_shelly else History.MISSING,
+    ))
+
+def refresh_jobs():
+    # datasets the settings do not use are never due, see dataset_needed()
+    return [
+        ('temperature', get_hko_station_index, (api_url['temperature'], 2, 0)),
+        ('humidity', get_hko_station_index, (api_url['humidity'], 2, 0)),
+        ('temperature_maxmin', get_hko_station_index, (api_url['temperature_maxmin'], [2,3], 0)),
+        ('weather', get_weather_icon, ()),
+        ('current', get_current_weather, ()),
+        ('forecast', get_forecast_data, ()),
+        ('warnsum', get_warning_summary, ()),
+        ('warnings', get_warning_data, ()),
+        ('shelly', get_shelly_data, ()),
+    ]
 
+async def retrieve_data():
+    """Fetch the due datasets, runs as a background task while the tick loop keeps going."""
+    global retrieval_state, retrieval_results
+
+    # get the due HKO and Shelly datasets at the same time, they stay marked
+    # with the start time until published unless a refresh is requested meanwhile
+    started = time.ticks_ms()
+    jobs = [job for job in refresh_jobs() if refresh_due(job[0], started)]
+    names = [job[0] for job in jobs]
+    for name in names:
+        next_refresh_ticks_ms[name] = started
+
+    results = {}
+    retrieval_results = (started, results)
     try:
-        # get HKO data
-        new_temp, new_temp_updtime = await get_hko_location_csv_values(api_url['temperature'], 2, 0)
-        new_humidity, new_humidity_updtime = await get_hko_location_csv_values(api_url['humidity'], 2, 0)
-        new_temp_maxmin, new_temp_maxmin_updtime = await get_hko_location_csv_values(api_url['temperature_maxmin'], [2,3], 0)
-        new_icon_idx, new_icon_updtime = await get_weather_icon()
-        new_forecast_data, new_forecast_updtime = await get_forecast_data()
-        new_warnings = await get_warning_data()
-
-        # get Shelly data
-        if enable_shelly:
-            shelly_data = await get_shelly_data()
-            if shelly_data:
-                shelly_tc = shelly_data[0]
-                shelly_rh = shelly_data[1]
-                shelly_updtime = shelly_data[2][-8:]
-
-        # update global var all at once
-        temp, temp_updtime = new_temp, new_temp_updtime
-        humidity, humidity_updtime = new_humidity, new_humidity_updtime
-        temp_maxmin, temp_maxmin_updtime = new_temp_maxmin, new_temp_maxmin_updtime
-        # icon_idx, icon_updtime = new_icon_idx, new_icon_updtime
-        forecast_data, forecast_updtime = new_forecast_data, new_forecast_updtime
-
-        # update weather icons
-        new_warnings.append(f'A:apps/{NAME}/resources/pic{new_icon_idx}.png')
-        if len(weather_icons) != len(new_warnings):
-            current_icon = 0
-        weather_icons = new_warnings.copy()
+        await fetch_concurrently(jobs, results)
+    except Exception as e:
+        for name in names:
+            results[name] = e
 
-        # all data is ready
-        pending_refresh_ui = True
-        set_status(None)
-        last_refresh_ticks_ms = time.ticks_ms()
+    retrieval_state = RETRIEVAL_PUBLISHING
 
+def results_ready():
+    # the fetch has ended, or some of its datasets are waiting to be published
+    return retrieval_state == RETRIEVAL_PUBLISHING or bool(retrieval_results and retrieval_results[1])
+
+def start_retrieval():
+    global retrieval_state, retrieval_task
+
+    retrieval_state = RETRIEVAL_FETCHING
+    retrieval_task = asyncio.create_task(retrieve_data())
+
+def cancel_retrieval():
+    # finished results are kept for publishing, only a running fetch is dropped
+    global retrieval_state, retrieval_task
+
+    if retrieval_state == RETRIEVAL_FETCHING:
+        retrieval_task.cancel()
+        retrieval_state = RETRIEVAL_IDLE
+    retrieval_task = None
+
+def result_empty(name, result):
+    # no warnings is a valid result, an empty one of any other dataset means nothing usable arrived
+    if result is None:
         return True
-    except Exception as e:
-        set_status("{}, {}".format(type(e).__name__, e.args), True, "retrieve_data()")
-        last_refresh_ticks_ms = time.ticks_ms()
+    if name in STATION_DATASETS:
+        return not result
+    if name in ('weather', 'forecast'):
+        return not result[0]
+    if name == 'current':
+        return not result[0] or not result[3]
+    if name == 'shelly':
+        return len(result) < 3
+    return False
+
+def apply_result(name, result):
+    """Merge the fetched result of dataset name into the app state.
+
+    An empty result raises ValueError, the last data of the dataset is kept.
+    """
+    global icon_idx, icon_updtime, current_updtime, forecast_data, forecast_updtime, warning_icons
+    global shelly_tc, shelly_rh, shelly_updtime
+
+    if result_empty(name, result):
+        raise ValueError("{} - no data in the response".format(name))
+
+    if name in STATION_DATASETS:
+        if data_source == DATA_SOURCE_RHRREAD and 'current' not in fetch_failures:
+            # stations the current weather report covers stay on its readings
+            readings = station_index.get(name, {})
+            result = dict(result)
+            for place in rhrread_places.get(name, ()):
+                if place in readings:
+                    result[place] = readings[place]
+        station_index[name] = result
+        select_station(station)
+    elif name == 'weather':
+        icon_idx, icon_updtime = result
+    elif name == 'current':
+        # merged over the regional CSV readings, which only remain for the stations it misses
+        icon_idx, icon_updtime, current_updtime, readings = result
+        for dataset in readings:
+            # a new dict, the CSV result may also be the one kept in http_cache
+            station_index[dataset] = dict(station_index.get(dataset, {}), **readings[dataset])
+            rhrread_places[dataset] = tuple(readings[dataset])
+        select_station(station)
+    elif name == 'forecast':
+        forecast_data, forecast_updtime = result
+    elif name == 'warnings':
+        warning_icons = result
+    elif name == 'shelly':
+        shelly_tc = result[0]
+        shelly_rh = result[1]
+        shelly_updtime = result[2][-8:]
+
+def publish_data():
+    """Apply the results that arrived since the last publish, the datasets that failed keep their last data.
+
+    Datasets that succeeded are rescheduled from their publication time, the
+    failed ones are retried with backoff, see schedule_retry().
+    """
+    global warnsum_digest
+    global data_stale
+    global retrieval_state, retrieval_results
+
+    started, results = retrieval_results
+    finished = retrieval_state == RETRIEVAL_PUBLISHING
+    if finished:
+        retrieval_results = None
+        retrieval_state = RETRIEVAL_IDLE
+    # the fetch task may still be adding results, the ones taken now are removed
+    ready = {}
+    for name in list(results):
+        ready[name] = results.pop(name)
+    # datasets requested again meanwhile stay due
+    marked = [name for name in ready if next_refresh_ticks_ms.get(name) == started]
+
+    succeeded = []
+    error = None
+    for name in ready:
+        result = ready[name]
+        try:
+            if isinstance(result, Exception):
+                raise result
+            if name == 'warnsum':
+                if result and result != warnsum_digest:
+                    # a warning was issued, changed or cancelled, the details are due now
+                    # unless they are being fetched together with the summary
+                    warnsum_digest = result
+                    if next_refresh_ticks_ms.get('warnings') != started:
+                        request_refresh(('warnings',))
+            else:
+                apply_result(name, result)
+            succeeded.append(name)
+            fetch_failures.pop(name, None)
+        except Exception as e:
+            error = e
+            schedule_retry(name, name in marked)
+
+    schedule_refresh([name for name in succeeded if name in marked])
+
+    if succeeded:
+        try:
+            if any(name in STATION_DATASETS or name in ('current', 'shelly') for name in succeeded):
+                record_history()
+            data_stale = False
+            publish_snapshot(build_snapshot())
+        except Exception as e:
+            error = e
+
+    if error:
+        set_status("{}, {}".format(type(error).__name__, error.args), True, "retrieve_data()")
+    elif finished:
+        if fetch_failures and error_message:
+            # the datasets still failing or behind an open breaker keep their last error shown
+            set_status(error_message, True, "retrieve_data()")
+        else:
+            set_status(None)
+
+    if finished:
+        save_data(True)
+        # the responses and parsed results of the whole fetch are garbage now
+        collect_garbage()
+    return error is None
+
+def ui_changed(widget, prop, value):
+    """Record value as the last one pushed to prop of widget, returns False if it is unchanged."""
+    global ui_updates
+
+    key = (id(widget), prop)
+    if key in ui_values and ui_values[key] == value:
         return False
+    ui_values[key] = value
+    ui_updates += 1
+    return True
+
+def ui_set_text(label, text):
+    if ui_changed(label, 'text', text):
+        label.set_text(text)
+
+def get_image(path):
+    """Return a descriptor of the PNG file bytes for an LVGL path, reading the file only on a cache miss.
+
+    The descriptor holds the file as stored, LVGL decodes it when it is shown.
+    Least recently used files are dropped to keep the cache within
+    IMAGE_CACHE_BYTES, except those still shown by a widget. A file that does
+    not fit next to the shown ones is not cached, and like a file that cannot
+    be read, is returned as the path for LVGL to read.
+    """
+    global image_cache_bytes
+
+    dsc = image_cache.get(path)
+    if dsc:
+        image_lru.remove(path)
+        image_lru.append(path)
+        return dsc
+
+    file = LVGL_DRIVE_ROOT + path[2:]
+    try:
+        size = os.stat(file)[6]
+    except OSError:
+        return path
+
+    in_use = [value for key, value in ui_values.items() if key[1] == 'src']
+    for old_path in image_lru[:]:
+        if image_cache_bytes + size <= IMAGE_CACHE_BYTES:
+            break
+        if old_path not in in_use:
+            image_lru.remove(old_path)
+            image_cache_bytes -= image_cache.pop(old_path).data_size
+    if image_cache_bytes + size > IMAGE_CACHE_BYTES:
+        return path
+
+    try:
+        with open(file, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return path
+
+    dsc = lv.image_dsc_t({'data_size': len(data), 'data': data})
+    image_cache[path] = dsc
+    image_lru.append(path)
+    image_cache_bytes += len(data)
+    return dsc
+
+def ui_set_src(image, src):
+    if ui_changed(image, 'src', src):
+        image.set_src(get_image(src))
+
+def ui_set_scale(image, scale):
+    if ui_changed(image, 'scale', scale):
+        image.set_scale(scale)
+
+def ui_set_hidden(obj, hidden):
+    if ui_changed(obj, 'hidden', hidden):
+        if hidden:
+            obj.add_flag(lv.obj.FLAG.HIDDEN)
+        else:
+            obj.remove_flag(lv.obj.FLAG.HIDDEN)
+
+def update_trend():
+    # redraw the sparkline only when a sample has been added
+    if not ui_changed(chart_trend, 'history', history.serial):
+        return
+
+    offset = HISTORY_SIZE - history.count
+    for series_idx, series, axis in ((HISTORY_TEMP, chart_temp_series, lv.chart.AXIS.PRIMARY_Y),
+                                     (HISTORY_HUMIDITY, chart_humidity_series, lv.chart.AXIS.SECONDARY_Y)):
+        low, high = 32767, -32767
+        for i in range(history.count):
+            value = history.get(series_idx, i)
+            if value != History.MISSING:
+                low = min(low, value)
+                high = max(high, value)
+        if low <= high:
+            chart_trend.set_range(axis, low - 5, high + 5)
+
+        # the latest sample is at the right end
+        for i in range(HISTORY_SIZE):
+            value = history.get(series_idx, i - offset) if i >= offset else History.MISSING
+            chart_trend.set_value_by_id(series, i, lv.CHART_POINT_NONE if value == History.MISSING else value)
+    chart_trend.refresh()
 
 def update_ui():
     global pending_refresh_ui
+    global ui_updates
 
+    ui_updates = 0
+    # the snapshot is read once, a publish in between only shows on the next update
+    snap = snapshot
+    if snap is None:
+        pending_refresh_ui = False
+        return
+
+    start = time.ticks_ms()
     try:
+        name, temp_text, temp_min_text, temp_max_text, humidity_text, updtime = snap.stations[current_station]
+
         # weather icon
-        icon_weather.set_src(weather_icons[current_icon])
+        if snap.icons:
+            ui_set_src(icon_weather, snap.icons[current_icon])
+        ui_set_hidden(icon_weather, not snap.icons)
 
         # temperature
-        lbl_temp.set_text(round_text(temp))
+        ui_set_text(lbl_temp, temp_text)
 
         # minimum and maximum temperature
-        if temp_maxmin:
-            lbl_temp_min.set_text(round_text(temp_maxmin[1]))
-            lbl_temp_max.set_text(round_text(temp_maxmin[0]))
+        if temp_min_text is not None:
+            ui_set_text(lbl_temp_min, temp_min_text)
+            ui_set_text(lbl_temp_max, temp_max_text)
 
         # humidity
-        lbl_humidity.set_text("{}".format(humidity))
+        ui_set_text(lbl_humidity, humidity_text)
 
         # HKO station
-        lbl_station.set_text(station)
+        ui_set_text(lbl_station, name)
+
+        # temperature and humidity trend
+        if chart_trend:
+            update_trend()
 
         # show weather icons
         for i in range(MAX_WARNINGS):
-            if i < len(weather_icons)-1:
-                obj_warnings[i].set_src(weather_icons[i])
-                obj_warnings[i].remove_flag(lv.obj.FLAG.HIDDEN)
+            if i < len(snap.warnings):
+                ui_set_src(obj_warnings[i], snap.warnings[i])
+                ui_set_hidden(obj_warnings[i], False)
             else:
-                obj_warnings[i].add_flag(lv.obj.FLAG.HIDDEN)
+                ui_set_hidden(obj_warnings[i], True)
 
-        # HKO update status
-        lbl_hko_updtime.set_text(temp_updtime[-8:])
+        # HKO update status, greyed out while showing the data saved before reboot
+        ui_set_text(lbl_hko_updtime, updtime)
+        if ui_changed(lbl_hko_updtime, 'stale', snap.stale):
+            lbl_hko_updtime.set_style_text_color(lv.palette_main(lv.PALETTE.GREY) if snap.stale else lv.color_white(),
+                                                 lv.PART.MAIN)
 
         if current_page == 1 or not enable_shelly:
-            if enable_shelly:
-                # show forecast page
-                btn_shelly.add_flag(lv.obj.FLAG.HIDDEN)
-                btn_forecast.remove_flag(lv.obj.FLAG.HIDDEN)
-
-            # if len(obj_forecast) == len(forecast_data) == int(forecast_days):
-            for i in range(int(forecast_days)):
-                if 'week' in obj_forecast[i] and 'week' in forecast_data[i]:
-                    obj_forecast[i]['week'].set_text(forecast_data[i]['week'][0:3])
-                    obj_forecast[i]['icon'].set_src(
-                        'A:apps/{}/resources/pic{}.png'.format(NAME, forecast_data[i]['ForecastIcon']))
-                    obj_forecast[i]['icon'].set_scale(forecast_config[forecast_days]['icon_scale'])
-                    obj_forecast[i]['temp'].set_text("{}-{}".format(forecast_data[i]['forecastMintemp']['value'],
-                                                                    forecast_data[i]['forecastMaxtemp']['value']))
+            # show forecast page, the panels may not be built yet
+            if btn_shelly:
+                ui_set_hidden(btn_shelly, True)
+            if btn_forecast:
+                ui_set_hidden(btn_forecast, False)
+
+            # cell i shows forecast day forecast_offset + i
+            offset = min(forecast_offset, max(0, len(snap.forecast) - len(obj_forecast)))
+            for i in range(len(obj_forecast)):
+                day = offset + i
+                if day < len(snap.forecast):
+                    week, icon, temp_range, stripe = snap.forecast[day]
+                    if ui_changed(obj_forecast[i]['cell'], 'stripe', stripe):
+                        obj_forecast[i]['cell'].set_style_bg_color(lv.color_hex(stripe), lv.PART.MAIN)
+                    ui_set_text(obj_forecast[i]['week'], week)
+                    ui_set_src(obj_forecast[i]['icon'], icon)
+                    ui_set_scale(obj_forecast[i]['icon'], forecast_config[forecast_days]['icon_scale'])
+                    ui_set_text(obj_forecast[i]['temp'], temp_range)
         else:
             # show Shelly page
-            btn_shelly.remove_flag(lv.obj.FLAG.HIDDEN)
-            btn_forecast.add_flag(lv.obj.FLAG.HIDDEN)
-
-            # Shelly status
-            lbl_shelly_temp.set_text(round_text(shelly_tc))
-            lbl_shelly_humidity.set_text("{}".format(round_text(shelly_rh)))
-            lbl_shelly_updtime.set_text(shelly_updtime)
+            if btn_forecast:
+                ui_set_hidden(btn_forecast, True)
+            if btn_shelly:
+                ui_set_hidden(btn_shelly, False)
+
+                # Shelly status
+                ui_set_text(lbl_shelly_temp, snap.shelly[0])
+                ui_set_text(lbl_shelly_humidity, snap.shelly[1])
+                ui_set_text(lbl_shelly_updtime, snap.shelly[2])
     except Exception as e:
         set_status("{}, {}".format(type(e).__name__, e.args), True, "update_ui()")
 
+    metrics.record_ui(time.ticks_diff(time.ticks_ms(), start), ui_updates)
+    if diagnostics_shown:
+        update_diagnostics()
     pending_refresh_ui = False
 
 def get_settings_json():
     return {
         "title": "HK Weather app settings",
         "form": [
-            # Station dropdown
+            # Station dropdowns, additional stations are shown in turn
             {
                 "type": "select",
                 "default": DEFAULT_LOCATION,
                 "caption": "HKO Station",
                 "name": "station",
-                "options": [
-                    ("Chek Lap Kok", "Chek Lap Kok"),
-                    ("Cheung Chau", "Cheung Chau"),
-                    ("Clear Water Bay", "Clear Water Bay"),
-                    ("Happy Valley", "Happy Valley"),
-                    ("HK Observatory", "HK Observatory"),
-                    ("HK Park", "HK Park"),
-                    ("Kai Tak Runway Park", "Kai Tak Runway Park"),
-                    ("Kau Sai Chau", "Kau Sai Chau"),
-                    ("King's Park", "King's Park"),
-                    ("Kowloon City", "Kowloon City"),
-                    ("Kwun Tong", "Kwun Tong"),
-                    ("Lau Fau Shan", "Lau Fau Shan"),
-                    ("Ngong Ping", "Ngong Ping"),
-                    ("Pak Tam Chung", "Pak Tam Chung"),
-                    ("Peng Chau", "Peng Chau"),
-                    ("Sai Kung", "Sai Kung"),
-                    ("Sha Tin", "Sha Tin"),
-                    ("Sham Shui Po", "Sham Shui Po"),
-                    ("Shau Kei Wan", "Shau Kei Wan"),
-                    ("Shek Kong", "Shek Kong"),
-                    ("Sheung Shui", "Sheung Shui"),
-                    ("Stanley", "Stanley"),
-                    ("Ta Kwu Ling", "Ta Kwu Ling"),
-                    ("Tai Lung", "Tai Lung"),
-                    ("Tai Mei Tuk", "Tai Mei Tuk"),
-                    ("Tai Mo Shan", "Tai Mo Shan"),
-                    ("Tai Po", "Tai Po"),
-                    ("Tate's Cairn", "Tate's Cairn"),
-                    ("The Peak", "The Peak"),
-                    ("Tseung Kwan O", "Tseung Kwan O"),
-                    ("Tsing Yi", "Tsing Yi"),
-                    ("Tsuen Wan Ho Koon", "Tsuen Wan Ho Koon"),
-                    ("Tsuen Wan Shing Mun Valley", "Tsuen Wan Shing Mun Valley"),
-                    ("Tuen Mun", "Tuen Mun"),
-                    ("Waglan Island", "Waglan Island"),
-                    ("Wetland Park", "Wetland Park"),
-                    ("Wong Chuk Hang", "Wong Chuk Hang"),
-                    ("Wong Tai Sin", "Wong Tai Sin"),
-                    ("Yuen Long Park", "Yuen Long Park")
-                ]
+                "options": [(name, name) for name in HKO_STATIONS]
+            },
+            {
+                "type": "select",
+                "default": "",
+                "caption": "2nd HKO Station (optional)",
+                "name": "station_2",
+                "options": [("None", "")] + [(name, name) for name in HKO_STATIONS]
+            },
+            {
+                "type": "select",
+                "default": "",
+                "caption": "3rd HKO Station (optional)",
+                "name": "station_3",
+                "options": [("None", "")] + [(name, name) for name in HKO_STATIONS]
             },
             {
                 "type": "radio",
@@ -450,6 +2025,13 @@ def get_settings_json():
                 "name": "forecast_days",
                 "options": [("5 Days", "5"), ("6 Days", "6"), ("7 Days", "7")],
             },
+            {
+                "type": "radio",
+                "default": DATA_SOURCE_CSV,
+                "caption": "Source of station readings",
+                "name": "data_source",
+                "options": [("Regional weather", DATA_SOURCE_CSV), ("Current weather report (fewer requests)", DATA_SOURCE_RHRREAD)],
+            },
             {
                 "type": "input",
                 "default": "",
@@ -461,35 +2043,81 @@ def get_settings_json():
     }
 
 def switch_page():
-    global last_switch_ticks_ms
     global pending_refresh_ui
     global current_page
 
     current_page = 0 if current_page == 1 else 1
     pending_refresh_ui = True
-    last_switch_ticks_ms = time.ticks_ms()
+    scheduler.set('rotate', PAGE_SWITCH_INTERVAL_MS, rotate_display)
+
+def scroll_forecast(step):
+    """Scroll the forecast strip by step days, returns False when already at that end."""
+    global forecast_offset
+    global pending_refresh_ui
+
+    if not obj_forecast:
+        return False
+
+    last_day = len(snapshot.forecast) if snapshot else 0
+    offset = min(forecast_offset, max(0, last_day - len(obj_forecast))) + step
+    if offset < 0 or offset + len(obj_forecast) > last_day:
+        return False
+
+    forecast_offset = offset
+    pending_refresh_ui = True
+    scheduler.set('rotate', PAGE_SWITCH_INTERVAL_MS, rotate_display)
+    return True
 
 def switch_icon():
     global current_icon
     global pending_refresh_ui
 
-    if len(weather_icons) > 1:
+    if snapshot and len(snapshot.icons) > 1:
         current_icon += 1
-        if current_icon >= len(weather_icons):
+        if current_icon >= len(snapshot.icons):
             current_icon = 0
         pending_refresh_ui = True
 
+def switch_station():
+    global current_station
+    global pending_refresh_ui
 
-def event_handler(event):
-    global last_refresh_ticks_ms
+    if len(stations) > 1:
+        # only the row shown changes, the readings globals stay on the primary station
+        current_station = (current_station + 1) % len(stations)
+        pending_refresh_ui = True
+
+def diagnostics_gesture():
+    """Note a knob press, returns True when it completes the gesture that opens the diagnostics page."""
+    now = time.ticks_ms()
+    enter_presses.append(now)
+    while time.ticks_diff(now, enter_presses[0]) > DIAGNOSTICS_GESTURE_MS:
+        enter_presses.pop(0)
+    if len(enter_presses) < DIAGNOSTICS_PRESSES:
+        return False
+    enter_presses.clear()
+    return True
 
+def event_handler(event):
     e_code = event.get_code()
-    if e_code == lv.EVENT.KEY:
+    if e_code == lv.EVENT.KEY and diagnostics_shown:
+        # any key closes the diagnostics page
+        show_diagnostics(False)
+    elif e_code == lv.EVENT.KEY:
         e_key = event.get_key()
         if e_key == lv.KEY.ENTER:
-            last_refresh_ticks_ms = None
+            # the refresh waits until the press can no longer be the start of the gesture,
+            # the gesture itself retrieves nothing
+            if diagnostics_gesture():
+                scheduler.cancel('enter')
+                show_diagnostics(True)
+            else:
+                scheduler.set('enter', DIAGNOSTICS_GESTURE_MS, request_refresh)
         elif e_key in (lv.KEY.RIGHT, lv.KEY.LEFT):
-            switch_page()
+            # the knob scrolls the forecast days first, past either end it switches page
+            if not ((current_page == 1 or not enable_shelly) and
+                    scroll_forecast(1 if e_key == lv.KEY.RIGHT else -1)):
+                switch_page()
     elif e_code == lv.EVENT.FOCUSED:
         if not lv.group_get_default().get_editing():
             lv.group_get_default().set_editing(True)
@@ -498,94 +2126,69 @@ async def on_boot(apm):
     global app_mgr
     app_mgr = apm
 
+    preallocate_buffers()
+
+    # show the last good dataset until the first refresh completes
+    load_data()
+
+def rotate_display():
+    # page, weather icon and station take turns every PAGE_SWITCH_INTERVAL_MS
+    if enable_shelly:
+        switch_page()
+    switch_icon()
+    switch_station()
+    scheduler.set('rotate', PAGE_SWITCH_INTERVAL_MS, rotate_display)
+
 async def on_running_foreground():
-    """Called when the app is active, approximately every 200ms."""
+    """Called when the app is active, approximately every 200ms.
 
-    global last_switch_ticks_ms
-    global pending_retrieval
-    global pending_refresh_ui
-    global current_page
+    Work flagged by the fetch task or the UI is done first, otherwise the tick only
+    compares the earliest scheduler deadline with the clock.
+    """
 
-    if pending_retrieval:
-        await retrieve_data()
+    # network fetches run in a background task, the tick only publishes finished results
+    if results_ready():
+        publish_data()
     elif pending_refresh_ui:
         update_ui()
-    elif last_refresh_ticks_ms is None or time.ticks_diff(time.ticks_ms(), last_refresh_ticks_ms) > REFRESH_INTERVAL_MS:
-        set_status("Retrieving network data...")
-        pending_retrieval = True
-    elif last_switch_ticks_ms and time.ticks_diff(time.ticks_ms(), last_switch_ticks_ms) > PAGE_SWITCH_INTERVAL_MS:
-        if enable_shelly:
-            switch_page()
-        switch_icon()
+    elif pending_builds:
+        run_pending_build()
+    else:
+        scheduler.run_due()
+
+async def on_running_background():
+    """Called when the app is not in the foreground, keeps the data fresh at a reduced cadence."""
+
+    global last_background_ticks_ms
+
+    if results_ready():
+        # widgets are updated by on_resume()/on_start() once the app is shown again
+        publish_data()
+    elif retrieval_state == RETRIEVAL_IDLE:
+        now = time.ticks_ms()
+        if (last_background_ticks_ms is None or
+                time.ticks_diff(now, last_background_ticks_ms) >= BACKGROUND_REFRESH_INTERVAL_MS) and any_refresh_due():
+            last_background_ticks_ms = now
+            start_retrieval()
 
 async def on_resume():
-    if last_refresh_ticks_ms:
+    if snapshot:
         update_ui()
 
 async def on_stop():
-    global scr
-
-    if scr:
-        scr.clean()
-        scr.delete_async()
-        scr = None
+    cancel_retrieval()
+    save_data()
+    collect_garbage()
 
-async def on_start():
-    global scr
-    global station
-    global forecast_days
-    global shelly_url
-    global enable_shelly
-    global last_refresh_ticks_ms
-    global last_switch_ticks_ms
-    global pending_refresh_ui
+    # the widget tree is kept for the next on_start(), scr is only loaded again
 
-    # top panel objects
+def build_top_panel():
+    """Build the readings at the top of the screen, the part shown in the first frame."""
     global icon_weather, lbl_temp, lbl_temp_degree, icon_temp_min, lbl_temp_min, lbl_temp_min_degree, icon_temp_max, lbl_temp_max, lbl_temp_max_degree
     global lbl_humidity, lbl_humidity_percent
     global lbl_station, lbl_hko_updtime
+    global obj_warnings
 
-    # status objects
-    global lbl_status_panel, lbl_status
-
-    # shelly objects
-    global btn_shelly, lbl_shelly_temp, lbl_shelly_humidity, lbl_shelly_updtime
-
-    # forecast objects
-    global btn_forecast
-
-    # get settings
-    s = app_mgr.config()
-    new_station = s.get("station", DEFAULT_LOCATION)
-    new_forecast_days = s.get("forecast_days", DEFAULT_FORECAST_DAYS)
-    new_shelly_url = s.get("shelly_url", "")
-    if new_station != station:
-        # force a data retrieval if station is changed
-        last_refresh_ticks_ms = None
-    elif new_forecast_days != forecast_days:
-        # force a UI refresh if forecast_days is changed
-        pending_refresh_ui = True
-    if new_shelly_url:
-        if new_shelly_url != shelly_url:
-            # force a data retrieval if shelly_url is changed
-            last_refresh_ticks_ms = None
-        enable_shelly = True
-    else:
-        if new_shelly_url != shelly_url:
-            # force a UI refresh if shelly_url is empty
-            pending_refresh_ui = True
-        enable_shelly = False
-
-    forecast_days = new_forecast_days
-    station = new_station
-    shelly_url = new_shelly_url
-    last_switch_ticks_ms = time.ticks_ms()
-
-    # Create and initialize LVGL widgets
-    scr = lv.obj()
-
-    """ Top panel
-    """
     # weather icon
     icon_weather = lv.image(scr)
     icon_weather.set_pos(0, 0)
@@ -648,7 +2251,6 @@ async def on_start():
     lbl_station.set_long_mode(lv.label.LONG.SCROLL_CIRCULAR)
 
     # warning icons
-    global obj_warnings
     obj_warnings = []
     offset = (SCR_WIDTH / 2) - 2.5 * 20
     for i in range(MAX_WARNINGS):
@@ -665,58 +2267,112 @@ async def on_start():
     lbl_hko_updtime.set_pos(257, 110)
     lbl_hko_updtime.set_style_text_font(lv.font_ascii_14, 0)
 
-    """ Shelly panel
-    """
-    # shelly section
-    if enable_shelly:
-        btn_shelly = lv.button(scr)
-        btn_shelly.set_pos(0, 130)
-        btn_shelly.set_size(SCR_WIDTH, 110)
-        btn_shelly.set_style_pad_all(0, lv.PART.MAIN)
-        btn_shelly.set_style_bg_color(lv.color_hex(0x1e5eb3), lv.PART.MAIN)
-
-        # home icon
-        icon_home = lv.image(btn_shelly)
-        icon_home.set_pos(10, 15)
-        icon_home.set_src(f'A:apps/{NAME}/resources/indoor_icon.png')
-
-        lbl_shelly_temp = lv.label(btn_shelly)
-        lbl_shelly_temp.set_pos(120, 15)
-        lbl_shelly_temp.set_style_text_font(lv.font_ascii_bold_48, 0)
-
-        lbl_shelly_temp_degree = lv.label(btn_shelly)
-        lbl_shelly_temp_degree.set_text("°C")
-        lbl_shelly_temp_degree.set_pos(180, 20)
-        lbl_shelly_temp_degree.set_style_text_font(lv.font_ascii_bold_28, 0)
-
-        lbl_shelly_humidity = lv.label(btn_shelly)
-        lbl_shelly_humidity.set_pos(227, 15)
-        lbl_shelly_humidity.set_style_text_font(lv.font_ascii_bold_48, 0)
-
-        lbl_shelly_humidity_degree = lv.label(btn_shelly)
-        lbl_shelly_humidity_degree.set_text("%")
-        lbl_shelly_humidity_degree.set_pos(282, 20)
-        lbl_shelly_humidity_degree.set_style_text_font(lv.font_ascii_bold_28, 0)
-
-        icon_shelly = lv.image(btn_shelly)
-        icon_shelly.set_src(f'A:apps/{NAME}/resources/shelly_icon.png')
-        icon_shelly.set_pos(120, 80)
-
-        lbl_shelly_updtime = lv.label(btn_shelly)
-        lbl_shelly_updtime.set_pos(257, 92)
-        lbl_shelly_updtime.set_style_text_font(lv.font_ascii_14, 0)
-
-    """ Forecast panel
-    """
-    # forecast section
+def build_status_panel():
+    global lbl_status_panel, lbl_status
+
+    lbl_status_panel = lv.button(scr)
+    lbl_status_panel.set_pos(0, 205)
+    lbl_status_panel.set_size(SCR_WIDTH, 35)
+    lbl_status_panel.set_style_radius(0,0)
+    lbl_status_panel.set_style_pad_all(3, lv.PART.MAIN)
+    lbl_status_panel.set_style_bg_color(lv.color_hex(0x0), lv.PART.MAIN)
+    lbl_status_panel.set_style_bg_opa(200, lv.PART.MAIN)
+
+    lbl_status = lv.label(lbl_status_panel)
+    lbl_status.set_width(SCR_WIDTH)
+    lbl_status.align(lv.ALIGN.CENTER, 0, 0)
+    lbl_status.set_long_mode(lv.label.LONG.SCROLL_CIRCULAR)
+    lbl_status.set_style_text_font(lv.font_ascii_bold_18, 0)
+
+def build_trend():
+    """Build the temperature and humidity trend of the last 24 hours."""
+    global chart_trend, chart_temp_series, chart_humidity_series
+
+    chart_trend = lv.chart(scr)
+    chart_trend.set_pos(120, 64)
+    chart_trend.set_size(190, 10)
+    chart_trend.set_type(lv.chart.TYPE.LINE)
+    chart_trend.set_point_count(HISTORY_SIZE)
+    chart_trend.set_div_line_count(0, 0)
+    chart_trend.set_style_bg_opa(0, lv.PART.MAIN)
+    chart_trend.set_style_border_width(0, lv.PART.MAIN)
+    chart_trend.set_style_pad_all(0, lv.PART.MAIN)
+    chart_trend.set_style_line_width(1, lv.PART.ITEMS)
+    chart_trend.set_style_size(0, 0, lv.PART.INDICATOR)
+    chart_temp_series = chart_trend.add_series(lv.palette_main(lv.PALETTE.BLUE), lv.chart.AXIS.PRIMARY_Y)
+    chart_humidity_series = chart_trend.add_series(lv.palette_main(lv.PALETTE.GREEN), lv.chart.AXIS.SECONDARY_Y)
+
+def build_shelly_panel():
+    """Build the indoor readings page, replacing the one built for earlier settings."""
+    global btn_shelly, lbl_shelly_temp, lbl_shelly_humidity, lbl_shelly_updtime
+
+    delete_shelly_panel()
+
+    btn_shelly = lv.button(scr)
+    btn_shelly.set_pos(0, 130)
+    btn_shelly.set_size(SCR_WIDTH, 110)
+    btn_shelly.set_style_pad_all(0, lv.PART.MAIN)
+    btn_shelly.set_style_bg_color(lv.color_hex(0x1e5eb3), lv.PART.MAIN)
+
+    # home icon
+    icon_home = lv.image(btn_shelly)
+    icon_home.set_pos(10, 15)
+    icon_home.set_src(f'A:apps/{NAME}/resources/indoor_icon.png')
+
+    lbl_shelly_temp = lv.label(btn_shelly)
+    lbl_shelly_temp.set_pos(120, 15)
+    lbl_shelly_temp.set_style_text_font(lv.font_ascii_bold_48, 0)
+
+    lbl_shelly_temp_degree = lv.label(btn_shelly)
+    lbl_shelly_temp_degree.set_text("°C")
+    lbl_shelly_temp_degree.set_pos(180, 20)
+    lbl_shelly_temp_degree.set_style_text_font(lv.font_ascii_bold_28, 0)
+
+    lbl_shelly_humidity = lv.label(btn_shelly)
+    lbl_shelly_humidity.set_pos(227, 15)
+    lbl_shelly_humidity.set_style_text_font(lv.font_ascii_bold_48, 0)
+
+    lbl_shelly_humidity_degree = lv.label(btn_shelly)
+    lbl_shelly_humidity_degree.set_text("%")
+    lbl_shelly_humidity_degree.set_pos(282, 20)
+    lbl_shelly_humidity_degree.set_style_text_font(lv.font_ascii_bold_28, 0)
+
+    icon_shelly = lv.image(btn_shelly)
+    icon_shelly.set_src(f'A:apps/{NAME}/resources/shelly_icon.png')
+    icon_shelly.set_pos(120, 80)
+
+    lbl_shelly_updtime = lv.label(btn_shelly)
+    lbl_shelly_updtime.set_pos(257, 92)
+    lbl_shelly_updtime.set_style_text_font(lv.font_ascii_14, 0)
+    ui_set_hidden(btn_shelly, current_page != 0)
+
+def delete_shelly_panel():
+    global btn_shelly, lbl_shelly_temp, lbl_shelly_humidity, lbl_shelly_updtime
+
+    if btn_shelly:
+        btn_shelly.delete()
+        btn_shelly = lbl_shelly_temp = lbl_shelly_humidity = lbl_shelly_updtime = None
+        # widgets built later may reuse the ids of the deleted ones
+        ui_values.clear()
+
+def build_forecast_panel():
+    """Build the forecast strip with forecast_days cells, replacing the one built for earlier settings."""
+    global btn_forecast
+    global obj_forecast
+
+    if btn_forecast:
+        btn_forecast.delete()
+        btn_forecast = None
+        obj_forecast = []
+        ui_values.clear()
+
     btn_forecast = lv.button(scr)
     btn_forecast.set_pos(0, 130)
     btn_forecast.set_size(SCR_WIDTH, 110)
     btn_forecast.set_style_pad_all(5, lv.PART.MAIN)
     btn_forecast.set_style_bg_color(lv.color_hex(0x1e5eb3), lv.PART.MAIN)
 
-    # weekday objects
-    global obj_forecast
+    # weekday cells, reused for whichever days the strip is scrolled to
     obj_forecast = []
     for i in range(int(forecast_days)):
         offset = round((SCR_WIDTH - 10) / int(forecast_days))
@@ -726,7 +2382,6 @@ async def on_start():
         btn_weekday.set_size(forecast_config[forecast_days]['width'], 100)
         btn_weekday.set_style_radius(0, 0)
         btn_weekday.set_style_pad_all(0, lv.PART.MAIN)
-        btn_weekday.set_style_bg_color(lv.color_hex(0x1e5eb3 if i % 2 == 0 else 0x277beb), lv.PART.MAIN)
 
         lbl_week = lv.label(btn_weekday)
         lbl_week.set_style_text_font(forecast_config[forecast_days]['weekday_font'], 0)
@@ -741,42 +2396,162 @@ async def on_start():
         lbl_temp_range.align(lv.ALIGN.TOP_MID, 0, forecast_config[forecast_days]['temp_y'])
 
         obj_forecast.append({
+            'cell': btn_weekday,
             'week': lbl_week,
             'icon': icon_week,
             'temp': lbl_temp_range,
         })
 
-    # toggle Shelly/forecast panel
-    if enable_shelly:
-        if current_page == 0:
-            btn_shelly.remove_flag(lv.obj.FLAG.HIDDEN)
-            btn_forecast.add_flag(lv.obj.FLAG.HIDDEN)
-        else:
-            btn_shelly.add_flag(lv.obj.FLAG.HIDDEN)
-            btn_forecast.remove_flag(lv.obj.FLAG.HIDDEN)
+    ui_set_hidden(btn_forecast, enable_shelly and current_page == 0)
+
+def build_diagnostics_panel():
+    global obj_diagnostics, lbl_diagnostics
+
+    obj_diagnostics = lv.obj(scr)
+    obj_diagnostics.set_pos(0, 0)
+    obj_diagnostics.set_size(SCR_WIDTH, SCR_HEIGHT)
+    obj_diagnostics.set_style_radius(0, 0)
+    obj_diagnostics.set_style_border_width(0, lv.PART.MAIN)
+    obj_diagnostics.set_style_pad_all(5, lv.PART.MAIN)
+    obj_diagnostics.set_style_bg_color(lv.color_hex(0x0), lv.PART.MAIN)
+
+    lbl_diagnostics = lv.label(obj_diagnostics)
+    lbl_diagnostics.set_width(SCR_WIDTH - 10)
+    lbl_diagnostics.set_style_text_font(lv.font_ascii_14, 0)
+    lbl_diagnostics.set_style_text_color(lv.color_white(), lv.PART.MAIN)
+
+def url_name(url):
+    # dataset name of an API URL, for display
+    if url == shelly_url:
+        return 'shelly'
+    for name in api_url:
+        if api_url[name] == url:
+            return name
+    return url
+
+def update_diagnostics():
+    lines = ["{:<12}{:>4}{:>5}{:>7}{:>7}{:>8}  {}".format('URL', 'req', 'fail', 'avg ms', 'max ms', 'bytes', 'last')]
+    summary = metrics.by_url()
+    for url in summary:
+        count, failures, total_ms, max_ms, size, status, error = summary[url]
+        lines.append("{:<12}{:>4}{:>5}{:>7}{:>7}{:>8}  {}".format(
+            url_name(url)[:12], count, failures, total_ms // count, max_ms, size, error or status))
+    if metrics.ui_runs:
+        lines.append("update_ui: {} runs, {} ms avg, {} ms max, {} widget updates".format(
+            metrics.ui_runs, metrics.ui_ms // metrics.ui_runs, metrics.ui_max_ms, metrics.ui_updates))
+    lines.append("HKO connections: {} handshakes in {} ms, {} reused, ~{} ms saved".format(
+        hko_session.handshakes, hko_session.handshake_ms, hko_session.reused, hko_session.saved_ms()))
+    lines.append("heap: {} KB free, {} KB peak, {} KB after {} collections (max {} ms)".format(
+        gc.mem_free() // 1024, metrics.heap_peak // 1024, metrics.heap_baseline // 1024,
+        metrics.collections, metrics.collect_max_ms))
+    lbl_diagnostics.set_text("\n".join(lines))
+
+def export_metrics():
+    """Write the instrumentation to METRICS_FILE as JSON, returns the exported dict."""
+    data = metrics.export()
+    try:
+        with open(METRICS_FILE, 'w') as f:
+            json.dump(data, f)
+    except Exception:
+        pass
+    return data
 
-    # status
-    lbl_status_panel = lv.button(scr)
-    lbl_status_panel.set_pos(0, 205)
-    lbl_status_panel.set_size(SCR_WIDTH, 35)
-    lbl_status_panel.set_style_radius(0,0)
-    lbl_status_panel.set_style_pad_all(3, lv.PART.MAIN)
-    lbl_status_panel.set_style_bg_color(lv.color_hex(0x0), lv.PART.MAIN)
-    lbl_status_panel.set_style_bg_opa(200, lv.PART.MAIN)
+def show_diagnostics(show):
+    global diagnostics_shown
+    global pending_refresh_ui
 
-    lbl_status = lv.label(lbl_status_panel)
-    lbl_status.set_width(SCR_WIDTH)
-    lbl_status.align(lv.ALIGN.CENTER, 0, 0)
-    lbl_status.set_long_mode(lv.label.LONG.SCROLL_CIRCULAR)
-    lbl_status.set_style_text_font(lv.font_ascii_bold_18, 0)
+    diagnostics_shown = show
+    if show:
+        if not obj_diagnostics:
+            build_diagnostics_panel()
+        obj_diagnostics.move_to_index(-1)
+        update_diagnostics()
+        export_metrics()
+    if obj_diagnostics:
+        ui_set_hidden(obj_diagnostics, not show)
+    pending_refresh_ui = True
+
+def queue_build(builder):
+    if builder not in pending_builds:
+        pending_builds.append(builder)
+
+def run_pending_build():
+    """Build the next queued screen section, one per tick so that the app keeps responding."""
+    global pending_refresh_ui
+
+    pending_builds.pop(0)()
+    # sections built later must not cover the status panel
+    lbl_status_panel.move_to_index(-1)
+    pending_refresh_ui = True
+
+async def on_start():
+    global scr
+    global stations, current_station
+    global forecast_days
+    global data_source
+    global shelly_url
+    global enable_shelly
+    global pending_refresh_ui
+
+    # get settings
+    s = app_mgr.config()
+    new_stations = [s.get("station", DEFAULT_LOCATION)]
+    for key in ("station_2", "station_3"):
+        if s.get(key) and s.get(key) not in new_stations:
+            new_stations.append(s.get(key))
+    new_forecast_days = s.get("forecast_days", DEFAULT_FORECAST_DAYS)
+    new_shelly_url = s.get("shelly_url", "")
+    new_data_source = s.get("data_source", DATA_SOURCE_CSV)
+    if new_data_source != data_source:
+        data_source = new_data_source
+        request_refresh(STATION_DATASETS + ('weather', 'current'))
+    if new_stations != stations:
+        # stations are served from the last station readings, only retrieve them if there are none yet
+        stations = new_stations
+        current_station = 0
+        if not select_station(stations[0]):
+            request_refresh(STATION_DATASETS + ('current',))
+        if snapshot:
+            publish_snapshot(build_snapshot())
+    if new_forecast_days != forecast_days and scr:
+        queue_build(build_forecast_panel)
+    if new_shelly_url:
+        if new_shelly_url != shelly_url:
+            # force a data retrieval if shelly_url is changed, failures of the old URL do not count
+            fetch_failures.pop('shelly', None)
+            request_refresh(('shelly',))
+        if not enable_shelly and scr:
+            queue_build(build_shelly_panel)
+        enable_shelly = True
+    else:
+        if enable_shelly:
+            delete_shelly_panel()
+        enable_shelly = False
+
+    forecast_days = new_forecast_days
+    shelly_url = new_shelly_url
+    scheduler.set('rotate', PAGE_SWITCH_INTERVAL_MS, rotate_display)
+    # the settings decide which datasets are in use
+    schedule_retrieval()
+
+    if not scr:
+        # only the top panel is built before the first frame, the other sections follow on later ticks
+        scr = lv.obj()
+        ui_values.clear()
+        build_top_panel()
+        build_status_panel()
+        pending_builds[:] = [build_trend, build_forecast_panel]
+        if enable_shelly:
+            pending_builds.insert(1, build_shelly_panel)
+
+        # register key event handler
+        scr.add_event(event_handler, lv.EVENT.ALL, None)
 
     set_status(error_message, error_message, "on_start()")
+    pending_refresh_ui = True
 
     lv.scr_load(scr)
 
-    # register key event handler
-    scr.add_event(event_handler, lv.EVENT.ALL, None)
-
     # set focus to default group so as to receive key events properly
     group = lv.group_get_default()
     if group:
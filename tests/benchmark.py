@@ -0,0 +1,85 @@
+"""Performance benchmark of a data refresh, run as `python tests/benchmark.py`.
+
+For each scenario the app is booted against the local HKO stand-in, and its
+first refresh of every dataset (run 1) and a refresh of unchanged data (run 2)
+are measured:
+
+- retrieve_data() wall time,
+- peak Python heap and net allocated blocks of retrieve_data() plus publish_data(),
+- requests and bytes on the wire,
+- widget operations of the update_ui() that shows the result.
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from harness import Harness, lvgl
+
+SCENARIOS = (
+    # name, Harness arguments, route changes
+    ('gzip', dict(), {}),
+    ('plain', dict(compress=False), {}),
+    ('gzip, 50 ms latency', dict(latency=0.05), {}),
+    ('rhrread source', dict(settings={'data_source': 'rhrread', 'station': "King's Park"}), {}),
+    ('plain, chunked, +16 KB', dict(compress=False), dict(chunked=True, padding=16 * 1024)),
+)
+
+
+async def measure_refresh(h):
+    """Fetch every dataset once more and publish it, returns the measurements."""
+    app = h.app
+    app.request_refresh()
+    h.server.reset_counters()
+
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    start = time.perf_counter()
+    await app.retrieve_data()
+    wall_ms = (time.perf_counter() - start) * 1000
+    app.publish_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sys.getallocatedblocks() - blocks
+
+    lvgl.reset()
+    app.update_ui()
+    return {
+        'retrieve_ms': wall_ms,
+        'peak_kb': peak / 1024,
+        'retained_blocks': retained,
+        'requests': h.server.requests,
+        'bytes': h.server.bytes_sent + h.server.bytes_received,
+        'widget_ops': lvgl.operations(),
+        'errors': app.error_message or '',
+    }
+
+
+async def run_scenario(harness_args, route_changes, repeat=1):
+    """Boot an app and return the measurements of its first refresh and of repeat more."""
+    async with Harness(**harness_args) as h:
+        for route in h.server.routes.values():
+            for key, value in route_changes.items():
+                setattr(route, key, value)
+        await h.boot()
+        # the whole screen, as it is once the staged build is done
+        while h.app.pending_builds:
+            h.app.run_pending_build()
+        return [await measure_refresh(h) for _ in range(1 + repeat)]
+
+
+def report(out=sys.stdout):
+    columns = ('retrieve_ms', 'peak_kb', 'retained_blocks', 'requests', 'bytes', 'widget_ops')
+    out.write('{:<28}{:>6}'.format('scenario', 'run') + ''.join('{:>16}'.format(c) for c in columns) + '\n')
+    for name, harness_args, route_changes in SCENARIOS:
+        results = asyncio.run(run_scenario(harness_args, route_changes))
+        for i, result in enumerate(results):
+            out.write('{:<28}{:>6}'.format(name, i + 1) +
+                      ''.join('{:>16.1f}'.format(result[c]) for c in columns) + '\n')
+            if result['errors']:
+                out.write('    error: {}\n'.format(result['errors']))
+
+
+if __name__ == '__main__':
+    report()
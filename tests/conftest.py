@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tests import the harness and the server directly, the harness puts the firmware stubs first on the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
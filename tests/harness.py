@@ -0,0 +1,164 @@
+"""Load the app headless against the local HKO stand-in.
+
+The app module is loaded from "HK Weather/__init__.py" with the stubs in
+tests/stubs in place of the firmware modules, a VirtualClock as its time
+module, its HKO session pointed at an HkoServer, its warm start file in a
+temporary directory and LVGL's 'A:' drive at a directory that holds the app,
+so icons are read from "HK Weather/resources".
+"""
+
+import asyncio
+import gc
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(os.path.dirname(TESTS), 'HK Weather', '__init__.py')
+
+sys.path.insert(0, os.path.join(TESTS, 'stubs'))
+
+import lvgl  # noqa: E402
+import net  # noqa: E402
+from hko_server import HkoServer  # noqa: E402
+
+# a foreground tick of the firmware
+TICK_MS = 200
+
+# MicroPython's heap statistics, approximated on the host by the allocated
+# blocks of HOST_BLOCK_SIZE bytes in a heap of HOST_HEAP_SIZE
+HOST_HEAP_SIZE = 64 * 1024 * 1024
+HOST_BLOCK_SIZE = 32
+if not hasattr(gc, 'mem_free'):
+    gc.mem_alloc = lambda: sys.getallocatedblocks() * HOST_BLOCK_SIZE
+    gc.mem_free = lambda: HOST_HEAP_SIZE - gc.mem_alloc()
+
+
+class VirtualClock:
+    """MicroPython's time functions on the host clock, which advance() moves ahead."""
+
+    def __init__(self):
+        self.offset_ms = 0
+
+    def advance(self, ms):
+        self.offset_ms += ms
+
+    def ticks_ms(self):
+        return int(time.monotonic() * 1000) + self.offset_ms
+
+    def ticks_add(self, ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(self, end, start):
+        return end - start
+
+    def time(self):
+        return time.time() + self.offset_ms // 1000
+
+    def mktime(self, t):
+        return int(time.mktime(tuple(t) + (-1,) * (9 - len(t))))
+
+    def localtime(self, secs=None):
+        return time.localtime(secs)
+
+
+class AppManager:
+    def __init__(self, settings):
+        self.settings = settings
+
+    def config(self):
+        return self.settings
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location('hk_weather', APP)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    app.time = VirtualClock()
+    return app
+
+
+class Harness:
+    """One app instance and its server, used as `async with Harness() as h:`."""
+
+    def __init__(self, settings=None, latency=0, compress=True, shelly=False):
+        self.settings = dict(settings or {})
+        self.server = HkoServer(latency=latency, compress=compress)
+        self.shelly = shelly
+        self.app = None
+        self.clock = None
+        self.tmp = None
+        # widget operations of each update_ui() call
+        self.update_ops = []
+
+    async def __aenter__(self):
+        await self.server.start()
+        if self.shelly:
+            self.settings.setdefault('shelly_url', self.server.shelly_url)
+        self.tmp = tempfile.TemporaryDirectory()
+        net.online = True
+        lvgl.reset()
+        self.app = load_app()
+        self.clock = self.app.time
+        self.app.DATA_FILE = os.path.join(self.tmp.name, 'last_data.txt')
+        self.app.METRICS_FILE = os.path.join(self.tmp.name, 'metrics.json')
+        os.mkdir(os.path.join(self.tmp.name, 'apps'))
+        os.symlink(os.path.dirname(APP), os.path.join(self.tmp.name, 'apps', self.app.NAME))
+        self.app.LVGL_DRIVE_ROOT = self.tmp.name + '/'
+        self.app.hko_session = self.app.HttpSession('127.0.0.1', self.server.port, ssl=False)
+
+        update_ui = self.app.update_ui
+
+        def counted_update_ui():
+            before = lvgl.operations()
+            update_ui()
+            self.update_ops.append(lvgl.operations() - before)
+        self.app.update_ui = counted_update_ui
+        return self
+
+    async def __aexit__(self, *exc):
+        self.app.cancel_retrieval()
+        self.app.hko_session.close()
+        await self.server.stop()
+        self.tmp.cleanup()
+
+    async def boot(self):
+        await self.app.on_boot(AppManager(self.settings))
+        await self.app.on_start()
+
+    async def tick(self, n=1):
+        # foreground ticks, letting the fetch task run in between
+        for _ in range(n):
+            await self.app.on_running_foreground()
+            await asyncio.sleep(0.005)
+
+    async def until(self, condition, timeout=10):
+        """Tick until condition() holds, returns the number of ticks."""
+        deadline = time.monotonic() + timeout
+        ticks = 0
+        while not condition():
+            if time.monotonic() > deadline:
+                raise TimeoutError("condition not met in {}s".format(timeout))
+            await self.tick()
+            ticks += 1
+        return ticks
+
+    async def refresh(self):
+        """Run the fetch of every due dataset to completion and publish it."""
+        app = self.app
+        await self.until(lambda: app.retrieval_state != app.RETRIEVAL_IDLE)
+        await self.until(lambda: app.retrieval_state == app.RETRIEVAL_IDLE and not app.pending_refresh_ui)
+
+    async def settle(self):
+        # first refresh plus the staged screen build
+        await self.refresh()
+        await self.until(lambda: not self.app.pending_builds and not self.app.pending_refresh_ui)
+
+    def advance(self, ms):
+        self.clock.advance(ms)
+
+
+def run(coro):
+    return asyncio.run(coro)
@@ -0,0 +1,168 @@
+"""Local stand-in for data.weather.gov.hk and a Shelly sensor.
+
+Serves the recorded responses in tests/fixtures over keep-alive HTTP/1.1 on
+127.0.0.1. Each route can be given latency, a different body or size, an HTTP
+error status or a dropped connection, and compressed, chunked or validated
+(ETag) responses. Requests and bytes on the wire are counted for benchmarks.
+"""
+
+import asyncio
+import gzip
+import os
+import zlib
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+HKO_OPENDATA = '/weatherAPI/opendata/weather.php?dataType={}&lang=en'
+HKO_REGIONAL = '/weatherAPI/hko_data/regional-weather/{}'
+SHELLY_PATH = '/shelly'
+
+# path -> fixture file
+RECORDED = {
+    HKO_OPENDATA.format('rhrread'): 'rhrread.json',
+    HKO_OPENDATA.format('fnd'): 'fnd.json',
+    HKO_OPENDATA.format('warningInfo'): 'warningInfo.json',
+    HKO_OPENDATA.format('warnsum'): 'warnsum.json',
+    HKO_REGIONAL.format('latest_1min_temperature.csv'): 'temperature.csv',
+    HKO_REGIONAL.format('latest_1min_humidity.csv'): 'humidity.csv',
+    HKO_REGIONAL.format('latest_since_midnight_maxmin.csv'): 'maxmin.csv',
+    SHELLY_PATH: 'shelly.txt',
+}
+
+
+class Route:
+    """How one path is answered.
+
+    latency: seconds before the response, status: HTTP status code,
+    drop: close the connection instead of answering, etag: send and honour
+    If-None-Match, compress: honour Accept-Encoding, chunked: chunked
+    transfer encoding, padding: bytes of whitespace appended to the body.
+    """
+
+    def __init__(self, body, latency=0, status=200, drop=False, etag=None, compress=True, chunked=False, padding=0):
+        self.body = body
+        self.latency = latency
+        self.status = status
+        self.drop = drop
+        self.etag = etag
+        self.compress = compress
+        self.chunked = chunked
+        self.padding = padding
+        self.requests = 0
+
+
+class HkoServer:
+    def __init__(self, latency=0, compress=True):
+        self.routes = {}
+        for path, name in RECORDED.items():
+            with open(os.path.join(FIXTURES, name), 'rb') as f:
+                self.routes[path] = Route(f.read(), latency=latency, compress=compress)
+        self.server = None
+        self.port = None
+        self.connections = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.not_modified = 0
+        self.log = []
+
+    def route(self, path):
+        # path is a dataType name of the opendata API, a regional CSV file name, or a full path
+        if path in self.routes:
+            return self.routes[path]
+        for candidate in (HKO_OPENDATA.format(path), HKO_REGIONAL.format(path)):
+            if candidate in self.routes:
+                return self.routes[candidate]
+        raise KeyError(path)
+
+    def reset_counters(self):
+        self.connections = self.requests = self.bytes_sent = self.bytes_received = self.not_modified = 0
+        self.log.clear()
+
+    @property
+    def shelly_url(self):
+        return 'http://127.0.0.1:{}{}'.format(self.port, SHELLY_PATH)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.bytes_received += len(line)
+                path = line.split()[1].decode()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    self.bytes_received += len(line)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode().split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+
+                self.requests += 1
+                self.log.append(path)
+                if not await self._respond(writer, path, headers) or headers.get('connection') == 'close':
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, path, headers):
+        # returns False when the connection is to be closed
+        route = self.routes.get(path)
+        if route is None:
+            return self._send(writer, 404, {}, b'')
+        route.requests += 1
+        if route.latency:
+            await asyncio.sleep(route.latency)
+        if route.drop:
+            return False
+        if route.status != 200:
+            return self._send(writer, route.status, {}, b'')
+
+        resp_headers = {}
+        if route.etag:
+            resp_headers['ETag'] = route.etag
+            if headers.get('if-none-match') == route.etag:
+                self.not_modified += 1
+                return self._send(writer, 304, resp_headers, None)
+
+        body = route.body + b' ' * route.padding
+        accepted = headers.get('accept-encoding', '')
+        if route.compress and 'gzip' in accepted:
+            body = gzip.compress(body)
+            resp_headers['Content-Encoding'] = 'gzip'
+        elif route.compress and 'deflate' in accepted:
+            body = zlib.compress(body)
+            resp_headers['Content-Encoding'] = 'deflate'
+        return self._send(writer, 200, resp_headers, body, route.chunked)
+
+    def _send(self, writer, status, headers, body, chunked=False):
+        head = 'HTTP/1.1 {} {}\r\n'.format(status, 'OK' if status == 200 else 'Status')
+        for key, value in headers.items():
+            head += '{}: {}\r\n'.format(key, value)
+        if body is None:
+            data = b''
+        elif chunked:
+            head += 'Transfer-Encoding: chunked\r\n'
+            data = b''.join(b'%x\r\n%s\r\n' % (len(body[i:i + 100]), body[i:i + 100])
+                            for i in range(0, len(body), 100)) + b'0\r\n\r\n'
+        else:
+            head += 'Content-Length: {}\r\n'.format(len(body))
+            data = body
+        message = (head + '\r\n').encode() + data
+        self.bytes_sent += len(message)
+        writer.write(message)
+        return True
@@ -0,0 +1,215 @@
+"""Soak test of the app lifecycle on a virtual clock, run as `python tests/soak.py [days]`.
+
+The app runs against the local HKO stand-in with its clock jumped straight to
+the next scheduler deadline, so each step is a refresh or a display rotation
+and a day of operation takes under a minute. Every STEPS_PER_CYCLE steps a cycle also:
+- turns the knob,
+- goes through stop, background and resume, and a settings change,
+- changes the recorded readings and the icon of the first forecast day.
+Every route sends an ETag, so unchanged datasets are answered from the app's
+HTTP cache. The icons are read from "HK Weather/resources" into an image cache
+of IMAGE_CACHE_BYTES, smaller than the app's so that files are evicted on every
+cycle. After each cycle, the live Python objects, the traced heap, the widgets
+on the screen and the app's caches are sampled.
+
+Growth is judged after the ring buffers and caches have filled up: the last
+quarter of the samples may not exceed the highest sample of the second quarter
+by more than the tolerance of each measure.
+"""
+
+import asyncio
+import gc
+import sys
+import tracemalloc
+import zlib
+
+from harness import Harness, lvgl
+
+STEPS_PER_CYCLE = 50
+DAY_MS = 24 * 60 * 60 * 1000
+
+# measure -> allowed growth
+TOLERANCE = {
+    'objects': 50,
+    'heap_kb': 32,
+    'widgets': 0,
+    'ui_values': 0,
+    'http_cache': 0,
+    'image_cache': 0,
+    'scheduler': 0,
+}
+
+# settings a cycle switches to and back from
+SETTINGS_CHANGES = (
+    {'station_2': 'Sha Tin'},
+    {'forecast_days': '5'},
+    {'shelly_url': None},
+    {'data_source': 'rhrread'},
+)
+
+TEMPERATURES = (b'26.4', b'27.9', b'25.1')
+FORECAST_ICONS = (b'50', b'60', b'70', b'80', b'90')
+
+# room for about four icons
+IMAGE_CACHE_BYTES = 32 * 1024
+
+
+def set_etag(route):
+    # a validator that changes with the body
+    route.etag = '"{:08x}"'.format(zlib.crc32(route.body))
+
+
+async def drain(h):
+    # finish the fetch, publish and redraw that a step started
+    app = h.app
+    while True:
+        if app.retrieval_state == app.RETRIEVAL_FETCHING:
+            await app.retrieval_task
+        if not (app.results_ready() or app.pending_refresh_ui or app.pending_builds):
+            return
+        await app.on_running_foreground()
+
+
+async def step(h):
+    """Jump to the next deadline and run it, returns the virtual ms that passed."""
+    app = h.app
+    await drain(h)
+    wait = app.scheduler.next_ms() or 0
+    h.advance(wait)
+    await app.on_running_foreground()
+    await drain(h)
+    return wait
+
+
+async def change_settings(h, cycle):
+    app = h.app
+    change = SETTINGS_CHANGES[cycle % len(SETTINGS_CHANGES)]
+    saved = {key: h.settings.get(key) for key in change}
+
+    for settings in (change, saved):
+        await app.on_stop()
+        for key, value in settings.items():
+            if value is None:
+                h.settings.pop(key, None)
+            else:
+                h.settings[key] = value
+        await app.on_start()
+        await drain(h)
+
+
+async def exercise(h, cycle):
+    app = h.app
+    # knob: scroll and switch page, refresh
+    for key in (lvgl.KEY.RIGHT, lvgl.KEY.RIGHT, lvgl.KEY.LEFT, lvgl.KEY.ENTER):
+        app.event_handler(lvgl.key_event(key))
+        await drain(h)
+
+    # in the background for an interval, then shown again
+    await app.on_stop()
+    h.advance(app.BACKGROUND_REFRESH_INTERVAL_MS)
+    await app.on_running_background()
+    if app.retrieval_task:
+        await app.retrieval_task
+    await app.on_running_background()
+    await app.on_start()
+    await app.on_resume()
+    await drain(h)
+
+    await change_settings(h, cycle)
+
+    route = h.server.route('latest_1min_temperature.csv')
+    route.body = route.body.replace(b'Peng Chau,' + TEMPERATURES[cycle % len(TEMPERATURES)],
+                                    b'Peng Chau,' + TEMPERATURES[(cycle + 1) % len(TEMPERATURES)])
+    set_etag(route)
+
+    route = h.server.route('fnd')
+    route.body = route.body.replace(b'"ForecastIcon": ' + FORECAST_ICONS[cycle % len(FORECAST_ICONS)],
+                                    b'"ForecastIcon": ' + FORECAST_ICONS[(cycle + 1) % len(FORECAST_ICONS)], 1)
+    set_etag(route)
+
+
+def sample(h, virtual_ms, steps):
+    app = h.app
+    not_modified = h.server.not_modified
+    # the server log and the harness counters grow with every request, they are not the app's
+    h.server.reset_counters()
+    h.update_ops.clear()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    return {
+        'hours': virtual_ms / 3600000,
+        'steps': steps,
+        'objects': len(gc.get_objects()),
+        'heap_kb': current / 1024,
+        'widgets': lvgl.tree_size(app.scr),
+        'ui_values': len(app.ui_values),
+        'http_cache': len(app.http_cache),
+        'image_cache': len(app.image_cache),
+        'scheduler': len(app.scheduler.queue),
+        # how the caches were used during the cycle, not judged for growth
+        'not_modified': not_modified,
+        'image_cache_kb': app.image_cache_bytes / 1024,
+        'images': tuple(sorted(app.image_cache)),
+    }
+
+
+async def soak(duration_ms, settings=None):
+    """Run the app for duration_ms of virtual time, returns the samples of every cycle."""
+    samples = []
+    # uncompressed, the host stand-in for the firmware's decompressor is slow
+    async with Harness(dict(settings or {'station': 'Peng Chau'}), compress=False, shelly=True) as h:
+        for route in h.server.routes.values():
+            set_etag(route)
+        h.app.IMAGE_CACHE_BYTES = IMAGE_CACHE_BYTES
+        # objects from before the boot are left out of every collection, which keeps
+        # the host's gc.collect() as quick as a collection of the app's heap alone
+        gc.freeze()
+        tracemalloc.start()
+        try:
+            await h.boot()
+            await drain(h)
+            virtual_ms = 0
+            steps = 0
+            cycle = 0
+            while virtual_ms < duration_ms:
+                for _ in range(STEPS_PER_CYCLE):
+                    virtual_ms += await step(h)
+                    steps += 1
+                await exercise(h, cycle)
+                cycle += 1
+                samples.append(sample(h, virtual_ms, steps))
+        finally:
+            tracemalloc.stop()
+            gc.unfreeze()
+    return samples
+
+
+def growth(samples):
+    """Measures that grew beyond their tolerance: name -> (reference, last quarter high)."""
+    quarter = len(samples) // 4
+    if quarter < 1:
+        raise ValueError("Soak too short to judge growth: {} samples".format(len(samples)))
+    grown = {}
+    for name, tolerance in TOLERANCE.items():
+        reference = max(s[name] for s in samples[quarter:2 * quarter])
+        last = max(s[name] for s in samples[-quarter:])
+        if last > reference + tolerance:
+            grown[name] = (reference, last)
+    return grown
+
+
+def report(samples, out=sys.stdout):
+    columns = ('hours', 'steps') + tuple(TOLERANCE) + ('not_modified', 'image_cache_kb')
+    out.write(''.join('{:>15}'.format(c) for c in columns) + '\n')
+    for s in samples:
+        out.write(''.join('{:>15.1f}'.format(s[c]) for c in columns) + '\n')
+
+
+if __name__ == '__main__':
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    samples = asyncio.run(soak(int(days * DAY_MS)))
+    report(samples)
+    grown = growth(samples)
+    for name, (reference, last) in grown.items():
+        print('{} grew from {:.1f} to {:.1f}'.format(name, reference, last))
+    sys.exit(1 if grown else 0)
@@ -0,0 +1,63 @@
+"""Stand-in for the firmware's arequests, one plain HTTP/1.1 request per connection."""
+
+import asyncio
+
+
+class _Body:
+    def __init__(self, reader, length):
+        self.reader = reader
+        self.left = length
+
+    async def read(self, n=-1):
+        if self.left is not None:
+            if not self.left:
+                return b''
+            n = self.left if n < 0 else min(n, self.left)
+        data = await self.reader.read(n)
+        if self.left is not None:
+            self.left -= len(data)
+        return data
+
+
+class Response:
+    def __init__(self, status_code, headers, reader, writer):
+        self.status_code = status_code
+        self.headers = headers
+        self.writer = writer
+        length = headers.get('Content-Length')
+        self.raw = _Body(reader, int(length) if length is not None else None)
+
+    @property
+    async def text(self):
+        return (await self.raw.read()).decode()
+
+    async def json(self):
+        import json
+        return json.loads(await self.raw.read())
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+
+async def get(url, headers=None, timeout=None):
+    scheme, _, rest = url.partition('://')
+    host, _, path = rest.partition('/')
+    host, _, port = host.partition(':')
+    reader, writer = await asyncio.open_connection(host, int(port or 80))
+    request = "GET /{} HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n".format(path, host)
+    for key in headers or {}:
+        request += "{}: {}\r\n".format(key, headers[key])
+    writer.write((request + "\r\n").encode())
+    await writer.drain()
+
+    status_code = int((await reader.readline()).split()[1])
+    resp_headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, value = line.decode().split(':', 1)
+        resp_headers[key.strip()] = value.strip()
+    return Response(status_code, resp_headers, reader, writer)
@@ -0,0 +1,36 @@
+"""Decompressing part of MicroPython's deflate module, built on zlib.
+
+Like the firmware, DeflateIO pulls its input from the stream one byte at a
+time, so a reader that lets the input run dry gets a truncated body.
+"""
+
+import zlib
+
+AUTO = 0
+RAW = 1
+ZLIB = 2
+GZIP = 3
+
+
+class DeflateIO:
+    def __init__(self, stream, format=AUTO, wbits=0, close=False):
+        self.stream = stream
+        wbits = wbits or 15
+        self.decompressor = zlib.decompressobj({AUTO: 32 + wbits, RAW: -wbits, ZLIB: wbits, GZIP: 16 + wbits}[format])
+        self.pending = b''
+
+    def read(self, n=-1):
+        byte = bytearray(1)
+        while (n < 0 or len(self.pending) < n) and not self.decompressor.eof:
+            if not self.stream.readinto(byte):
+                break
+            self.pending += self.decompressor.decompress(bytes(byte))
+        if n < 0:
+            n = len(self.pending)
+        data, self.pending = self.pending[:n], self.pending[n:]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
@@ -0,0 +1,166 @@
+"""Headless stand-in for the LVGL bindings, counting the widget calls the app makes."""
+
+from collections import Counter
+
+# calls per widget method name, and widgets created
+calls = Counter()
+created = Counter()
+
+
+def reset():
+    calls.clear()
+    created.clear()
+
+
+def operations():
+    # widget method calls, i.e. the work LVGL would do to redraw
+    return sum(calls.values())
+
+
+def tree_size(root):
+    # widgets in the tree under root, root included
+    return 1 + sum(tree_size(child) for child in root.children) if root is not None else 0
+
+
+class _Constant:
+    """Any attribute path, e.g. lv.PALETTE.BLUE or lv.font_ascii_bold_48."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, name):
+        return _Constant(self._name + '.' + name)
+
+    def __call__(self, *args, **kwargs):
+        return _Constant(self._name + '()')
+
+    def __repr__(self):
+        return self._name
+
+
+class obj:
+    FLAG = _Constant('obj.FLAG')
+
+    def __init__(self, parent=None):
+        created[type(self).__name__] += 1
+        self.parent = parent
+        self.children = []
+        self.state = {}
+        self.flags = set()
+        self.deleted = False
+        if parent is not None:
+            parent.children.append(self)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def method(*args):
+            calls[name] += 1
+            self.state[name] = args
+        return method
+
+    def add_flag(self, flag):
+        calls['add_flag'] += 1
+        self.flags.add(repr(flag))
+
+    def remove_flag(self, flag):
+        calls['remove_flag'] += 1
+        self.flags.discard(repr(flag))
+
+    def has_flag(self, flag):
+        return repr(flag) in self.flags
+
+    def get_text(self):
+        return self.state.get('set_text', (None,))[0]
+
+    def delete(self):
+        calls['delete'] += 1
+        self.deleted = True
+        if self.parent is not None and self in self.parent.children:
+            self.parent.children.remove(self)
+
+    def delete_async(self):
+        self.delete()
+
+    def clean(self):
+        calls['clean'] += 1
+        self.children = []
+
+    def add_series(self, color, axis):
+        calls['add_series'] += 1
+        return _Constant('series')
+
+
+class image(obj):
+    pass
+
+
+class label(obj):
+    LONG = _Constant('label.LONG')
+
+
+class button(obj):
+    pass
+
+
+class chart(obj):
+    TYPE = _Constant('chart.TYPE')
+    AXIS = _Constant('chart.AXIS')
+
+
+class image_dsc_t:
+    def __init__(self, dsc):
+        self.data_size = dsc['data_size']
+        self.data = dsc['data']
+
+
+class EVENT:
+    ALL = 0
+    KEY = 1
+    FOCUSED = 2
+
+
+class KEY:
+    ENTER = 10
+    RIGHT = 19
+    LEFT = 20
+    UP = 17
+    DOWN = 18
+    ESC = 27
+
+
+class _Event:
+    def __init__(self, code, key=None):
+        self.code = code
+        self.key = key
+
+    def get_code(self):
+        return self.code
+
+    def get_key(self):
+        return self.key
+
+
+def key_event(key):
+    return _Event(EVENT.KEY, key)
+
+
+CHART_POINT_NONE = 0x7fffffff
+
+screen = None
+
+
+def scr_load(scr):
+    global screen
+    calls['scr_load'] += 1
+    screen = scr
+
+
+def group_get_default():
+    return None
+
+
+def __getattr__(name):
+    # colours, fonts, palettes, alignments and parts
+    return _Constant(name)
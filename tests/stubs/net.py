@@ -0,0 +1,8 @@
+"""Stand-in for the firmware's net module."""
+
+# set to False to simulate a dropped Wi-Fi connection
+online = True
+
+
+def connected():
+    return online
@@ -0,0 +1,5 @@
+"""Stand-in for the firmware's peripherals module."""
+
+
+class screen:
+    screen_resolution = (320, 240)
@@ -0,0 +1,574 @@
+import json
+
+from harness import AppManager, Harness, load_app, lvgl, net, run
+
+
+def test_first_refresh_shows_all_datasets():
+    async def scenario():
+        async with Harness({'station': 'Sha Tin'}, shelly=True) as h:
+            await h.boot()
+            await h.settle()
+            snap = h.app.snapshot
+            assert h.app.error_message is None
+            assert snap.stations == (('Sha Tin', '27', '24', '32', '76', '12:30:00'),)
+            assert snap.icons[-1].endswith('pic62.png') and len(snap.icons) == 3
+            assert len(snap.forecast) == 9 and snap.forecast[0][:3] == ('Thu', 'A:apps/HK Weather/resources/pic50.png', '25-30')
+            assert snap.shelly == ('24', '55', '12:29:31')
+            assert h.app.lbl_temp.get_text() == '27'
+    run(scenario())
+
+
+def test_compressed_and_chunked_bodies_parse_alike():
+    async def snapshot(compress, chunked):
+        async with Harness(compress=compress) as h:
+            for route in h.server.routes.values():
+                route.chunked = chunked
+            await h.boot()
+            await h.settle()
+            snap = h.app.snapshot
+            return snap.stations, snap.icons, snap.forecast
+
+    plain = run(snapshot(False, False))
+    assert run(snapshot(True, False)) == plain
+    assert run(snapshot(True, True)) == plain
+    assert run(snapshot(False, True)) == plain
+
+
+def test_unchanged_refresh_updates_no_widgets():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            updates = len(h.update_ops)
+            h.app.request_refresh()
+            await h.refresh()
+            assert len(h.update_ops) > updates
+            return sum(h.update_ops[updates:])
+    assert run(scenario()) == 0
+
+
+def test_validated_responses_are_not_downloaded_again():
+    async def scenario():
+        async with Harness() as h:
+            h.server.route('fnd').etag = '"fnd-1"'
+            await h.boot()
+            await h.settle()
+            forecast = h.app.snapshot.forecast
+            h.server.reset_counters()
+            h.app.request_refresh()
+            await h.refresh()
+            assert h.server.route('fnd').requests == 2
+            assert h.app.snapshot.forecast == forecast
+            return h.server.bytes_sent
+    async def full():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            h.server.reset_counters()
+            h.app.request_refresh()
+            await h.refresh()
+            return h.server.bytes_sent
+    assert run(scenario()) < run(full())
+
+
+def test_failed_dataset_keeps_its_last_data():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            forecast = h.app.snapshot.forecast
+            h.server.route('fnd').drop = True
+            temperature = h.server.route('latest_1min_temperature.csv')
+            temperature.body = temperature.body.replace(b'Peng Chau,26.4', b'Peng Chau,30.4')
+            h.app.request_refresh()
+            await h.refresh()
+            assert h.app.snapshot.forecast == forecast
+            assert h.app.error_message and h.app.fetch_failures == {'forecast': 1}
+            assert h.app.lbl_temp.get_text() == '30'
+            # retried after RETRY_BASE_DELAY rather than the forecast schedule
+            wait = h.app.time.ticks_diff(h.app.next_refresh_ticks_ms['forecast'], h.app.time.ticks_ms())
+            assert 25 * 1000 < wait <= (h.app.RETRY_BASE_DELAY + h.app.REFRESH_JITTER) * 1000
+
+            h.server.route('fnd').drop = False
+            h.advance(wait)
+            await h.refresh()
+            assert not h.app.fetch_failures and not h.app.error_message
+    run(scenario())
+
+
+def test_offline_refresh_keeps_the_last_data():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            snap = h.app.snapshot
+            with open(h.app.DATA_FILE) as f:
+                saved = f.read()
+
+            net.online = False
+            for _ in range(h.app.BREAKER_THRESHOLD + 1):
+                h.app.request_refresh()
+                await h.refresh()
+            assert (h.app.snapshot.stations, h.app.snapshot.icons, h.app.snapshot.forecast) == (
+                snap.stations, snap.icons, snap.forecast)
+            assert h.app.lbl_temp.get_text() == '26'
+            assert h.app.error_message and h.app.fetch_failures
+            assert not any(h.app.breaker_open(name) for name in h.app.fetch_failures)
+            with open(h.app.DATA_FILE) as f:
+                assert f.read() == saved
+
+            net.online = True
+            h.app.request_refresh()
+            await h.refresh()
+            assert not h.app.fetch_failures and not h.app.error_message
+    run(scenario())
+
+
+def test_no_weather_icon_is_shown_before_the_weather_is_known():
+    async def scenario():
+        async with Harness() as h:
+            h.server.route('rhrread').drop = True
+            await h.boot()
+            await h.settle()
+            snap = h.app.snapshot
+            assert snap.icons == snap.warnings and len(snap.warnings) == 2
+            for _ in snap.icons:
+                h.app.switch_icon()
+                h.app.update_ui()
+                assert h.app.ui_values[(id(h.app.icon_weather), 'src')] in snap.warnings
+
+            # nor without warnings
+            h.app.warning_icons = []
+            h.app.publish_snapshot(h.app.build_snapshot())
+            h.app.update_ui()
+            assert h.app.snapshot.icons == ()
+            assert h.app.icon_weather.has_flag(h.app.lv.obj.FLAG.HIDDEN)
+            assert h.app.obj_warnings[0].has_flag(h.app.lv.obj.FLAG.HIDDEN)
+
+            h.server.route('rhrread').drop = False
+            h.app.request_refresh()
+            await h.refresh()
+            snap = h.app.snapshot
+            assert snap.icons == snap.warnings + ('A:apps/HK Weather/resources/pic62.png',)
+            assert not h.app.icon_weather.has_flag(h.app.lv.obj.FLAG.HIDDEN)
+    run(scenario())
+
+
+async def poll_warning_summary(h):
+    # the next warning summary poll, and the fetch it may have requested
+    app = h.app
+    h.advance(app.time.ticks_diff(app.next_refresh_ticks_ms['warnsum'], app.time.ticks_ms()))
+    await h.refresh()
+    await h.tick(3)
+    await h.until(lambda: app.retrieval_state == app.RETRIEVAL_IDLE and not app.pending_refresh_ui)
+
+
+def test_changed_warning_summary_fetches_the_warning_details():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            details = h.server.route('warningInfo')
+            assert details.requests == 1 and len(h.app.snapshot.warnings) == 2
+
+            # the Very Hot Weather Warning is cancelled
+            summary = h.server.route('warnsum')
+            summary.body = summary.body[:1] + summary.body[summary.body.index(b'"WTCSGNL"'):]
+            details.body = details.body[:13] + details.body[details.body.index(b'{"contents": ["Strong'):]
+            await poll_warning_summary(h)
+            assert details.requests == 2
+            assert h.app.snapshot.warnings == ('A:apps/HK Weather/resources/tc3.png',)
+    run(scenario())
+
+
+def test_unchanged_warning_summary_does_not_fetch_the_warning_details():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            for _ in range(3):
+                await poll_warning_summary(h)
+            assert h.server.route('warnsum').requests == 4
+            assert h.server.route('warningInfo').requests == 1
+    run(scenario())
+
+
+def test_slow_dataset_does_not_hold_back_the_others():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            h.server.route('fnd').latency = 1
+            temperature = h.server.route('latest_1min_temperature.csv')
+            temperature.body = temperature.body.replace(b'Peng Chau,26.4', b'Peng Chau,30.4')
+            h.app.request_refresh()
+            await h.until(lambda: h.app.lbl_temp.get_text() == '30')
+            assert h.app.retrieval_state == h.app.RETRIEVAL_FETCHING
+            await h.refresh()
+            assert not h.app.error_message
+    run(scenario())
+
+
+def test_circuit_breaker_stops_requests_to_a_dead_endpoint():
+    async def scenario():
+        async with Harness(shelly=True) as h:
+            h.server.route('/shelly').status = 500
+            await h.boot()
+            await h.settle()
+            for _ in range(h.app.BREAKER_THRESHOLD - 1):
+                h.advance(h.app.time.ticks_diff(h.app.next_refresh_ticks_ms['shelly'], h.app.time.ticks_ms()))
+                await h.refresh()
+            assert h.app.breaker_open('shelly')
+            assert h.server.route('/shelly').requests == h.app.BREAKER_THRESHOLD
+
+            # a refresh request leaves it alone until the next probe
+            h.app.request_refresh()
+            await h.refresh()
+            assert h.server.route('/shelly').requests == h.app.BREAKER_THRESHOLD
+            wait = h.app.time.ticks_diff(h.app.next_refresh_ticks_ms['shelly'], h.app.time.ticks_ms())
+            assert wait > (h.app.BREAKER_PROBE_DELAY - 5) * 1000
+
+            # a probe that succeeds closes it
+            h.server.route('/shelly').status = 200
+            h.advance(wait)
+            await h.refresh()
+            assert not h.app.breaker_open('shelly') and h.app.snapshot.shelly[0] == '24'
+    run(scenario())
+
+
+def test_open_breaker_does_not_leave_the_retrieving_banner():
+    from soak import step
+
+    async def scenario():
+        async with Harness(shelly=True) as h:
+            h.server.route('/shelly').status = 500
+            await h.boot()
+            await h.settle()
+            while not h.app.breaker_open('shelly'):
+                await step(h)
+            for _ in range(10):
+                await step(h)
+                assert h.app.lbl_status.get_text() != "Retrieving network data..."
+            # the error of the dead endpoint stays shown
+            assert h.app.error_message in h.app.lbl_status.get_text()
+            assert not h.app.lbl_status_panel.has_flag(h.app.lv.obj.FLAG.HIDDEN)
+    run(scenario())
+
+
+def test_dropped_connection_is_reported():
+    async def scenario():
+        async with Harness() as h:
+            h.server.route('latest_1min_temperature.csv').drop = True
+            await h.boot()
+            await h.refresh()
+            assert 'latest_1min_temperature.csv' in h.app.error_message
+    run(scenario())
+
+
+def test_enter_key_requests_a_refresh():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            requests = h.server.requests
+            h.app.event_handler(lvgl.key_event(lvgl.KEY.ENTER))
+            await h.tick(3)
+            assert h.server.requests == requests
+            h.advance(h.app.DIAGNOSTICS_GESTURE_MS)
+            await h.refresh()
+            assert h.server.requests > requests
+    run(scenario())
+
+
+def test_warm_start_shows_the_saved_data_greyed_out():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            warm = load_app()
+            warm.DATA_FILE = h.app.DATA_FILE
+            await warm.on_boot(AppManager({}))
+            assert warm.snapshot.stations == h.app.snapshot.stations
+            assert warm.snapshot.forecast == h.app.snapshot.forecast
+            assert warm.snapshot.stale and not h.app.snapshot.stale
+    run(scenario())
+
+
+def test_fetches_are_recorded_per_url():
+    async def scenario():
+        async with Harness(shelly=True) as h:
+            h.server.route('warningInfo').drop = True
+            await h.boot()
+            await h.settle()
+            summary = h.app.metrics.by_url()
+            names = sorted(h.app.url_name(url) for url in summary)
+            assert names == ['forecast', 'humidity', 'shelly', 'temperature', 'temperature_maxmin',
+                             'warnings', 'warnsum', 'weather']
+            fetches, failures, _, _, size, status, error = summary[h.app.api_url['forecast']]
+            assert (fetches, failures, status, error) == (1, 0, 200, '') and size > 1000
+            fetches, failures, _, _, size, status, error = summary[h.app.api_url['warnings']]
+            assert failures == 1 and status is None and error
+    run(scenario())
+
+
+def test_knob_gesture_opens_the_diagnostics_page():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            fetches = h.app.metrics.recent()
+            for _ in range(3):
+                await h.tick()
+                h.app.event_handler(lvgl.key_event(lvgl.KEY.ENTER))
+            assert h.app.diagnostics_shown
+            assert 'forecast' in h.app.lbl_diagnostics.get_text()
+            with open(h.app.METRICS_FILE) as f:
+                exported = json.load(f)
+            assert len(exported['fetches']) == len(h.app.metrics.recent())
+            assert exported['update_ui']['runs'] == h.app.metrics.ui_runs > 0
+            assert exported['update_ui']['widget_updates'] > 0
+
+            h.app.event_handler(lvgl.key_event(lvgl.KEY.RIGHT))
+            assert not h.app.diagnostics_shown
+            assert h.app.obj_diagnostics.has_flag(h.app.lv.obj.FLAG.HIDDEN)
+            assert h.app.forecast_offset == 0
+
+            # the gesture retrieved nothing
+            h.advance(h.app.DIAGNOSTICS_GESTURE_MS)
+            await h.tick(3)
+            assert h.app.retrieval_state == h.app.RETRIEVAL_IDLE
+            assert h.app.metrics.recent() == fetches
+    run(scenario())
+
+
+def test_knob_scrolls_the_forecast_and_switches_page_past_either_end():
+    async def scenario():
+        async with Harness(shelly=True) as h:
+            app = h.app
+            await h.boot()
+            await h.settle()
+            days = [day[0] for day in app.snapshot.forecast]
+            cells = [cell['week'] for cell in app.obj_forecast]
+            widgets = lvgl.tree_size(app.scr)
+            assert len(days) == 9 and len(cells) == 6
+
+            async def turn(key):
+                app.event_handler(lvgl.key_event(key))
+                await h.until(lambda: not app.pending_refresh_ui)
+
+            def shown():
+                return [label.get_text() for label in cells]
+
+            # from the indoor sensor page to the forecast, through the days and back past the last one
+            assert app.current_page == 0
+            await turn(lvgl.KEY.RIGHT)
+            assert app.current_page == 1 and shown() == days[:6]
+            for offset in range(1, 4):
+                await turn(lvgl.KEY.RIGHT)
+                assert app.current_page == 1 and shown() == days[offset:offset + 6]
+            await turn(lvgl.KEY.RIGHT)
+            assert app.current_page == 0 and app.forecast_offset == 3
+
+            # and the other way, past the first day
+            await turn(lvgl.KEY.LEFT)
+            assert app.current_page == 1 and shown() == days[3:]
+            for offset in range(2, -1, -1):
+                await turn(lvgl.KEY.LEFT)
+                assert app.current_page == 1 and shown() == days[offset:offset + 6]
+            await turn(lvgl.KEY.LEFT)
+            assert app.current_page == 0 and app.forecast_offset == 0
+
+            # the same cells showed every day
+            assert [cell['week'] for cell in app.obj_forecast] == cells
+            assert lvgl.tree_size(app.scr) == widgets
+    run(scenario())
+
+
+def test_refreshes_reuse_the_preallocated_buffers():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            buffers = set(map(id, h.app.read_buffers))
+            inputs = set(map(id, h.app.inflate_inputs))
+            assert len(buffers) == len(inputs) == h.app.MAX_CONCURRENT_FETCHES
+            await h.settle()
+            for _ in range(3):
+                h.app.request_refresh()
+                await h.refresh()
+            assert set(map(id, h.app.read_buffers)) == buffers
+            assert set(map(id, h.app.inflate_inputs)) == inputs
+            assert h.app.metrics.collections == 4
+            assert h.app.metrics.heap_peak >= h.app.metrics.heap_baseline > 0
+    run(scenario())
+
+
+def test_image_cache_stays_within_its_budget():
+    async def scenario():
+        async with Harness() as h:
+            app = h.app
+            await h.boot()
+            await h.settle()
+            assert app.image_cache and app.image_cache_bytes <= app.IMAGE_CACHE_BYTES
+            assert app.obj_forecast[0]['icon'].state['set_src'][0] is app.image_cache[app.snapshot.forecast[0][1]]
+
+        async with Harness() as h:
+            app = h.app
+            # room for about three icons, fewer than the forecast cells shown
+            app.IMAGE_CACHE_BYTES = 24 * 1024
+            await h.boot()
+            await h.settle()
+            cached = set(app.image_cache)
+            for key in [lvgl.KEY.RIGHT] * 3 + [lvgl.KEY.LEFT] * 3:
+                app.event_handler(lvgl.key_event(key))
+                await h.until(lambda: not app.pending_refresh_ui)
+                assert app.image_cache_bytes == sum(dsc.data_size for dsc in app.image_cache.values())
+                assert app.image_cache_bytes <= app.IMAGE_CACHE_BYTES
+                assert sorted(app.image_lru) == sorted(app.image_cache)
+                cached.update(app.image_cache)
+            # files were dropped for the newly shown ones, the ones that did not fit are read by LVGL
+            assert cached - set(app.image_cache)
+            sources = [cell['icon'].state['set_src'][0] for cell in app.obj_forecast]
+            assert any(isinstance(src, str) for src in sources)
+    run(scenario())
+
+
+def test_warm_start_data_of_another_station_is_not_shown():
+    async def scenario():
+        async with Harness({'station': 'Sha Tin'}) as h:
+            await h.boot()
+            await h.settle()
+            warm = load_app()
+            warm.DATA_FILE = h.app.DATA_FILE
+            await warm.on_boot(AppManager({'station': 'Peng Chau'}))
+            assert warm.snapshot.stations[0][:2] == ('Sha Tin', '27')
+            await warm.on_start()
+            assert warm.snapshot.stations == (('Peng Chau', '', None, None, '', ''),)
+            assert warm.snapshot.forecast == h.app.snapshot.forecast
+    run(scenario())
+
+
+def test_warm_start_file_is_written_at_most_every_save_interval():
+    from soak import step
+
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            route = h.server.route('latest_1min_temperature.csv')
+            writes = set()
+            elapsed = 0
+            while elapsed < 60 * 60 * 1000:
+                old, new = (b'26.4', b'27.9') if b'Peng Chau,26.4' in route.body else (b'27.9', b'26.4')
+                route.body = route.body.replace(b'Peng Chau,' + old, b'Peng Chau,' + new)
+                elapsed += await step(h)
+                writes.add(h.app.last_save_ticks_ms)
+            assert len(writes) <= 60 * 60 * 1000 // h.app.SAVE_INTERVAL_MS + 1
+
+            await h.app.on_stop()
+            with open(h.app.DATA_FILE) as f:
+                assert h.app.temp in f.read()
+    run(scenario())
+
+
+def test_refresh_backs_off_while_the_publication_time_stands_still():
+    app = load_app()
+    app.REFRESH_JITTER = 0
+    app.forecast_updtime = '2024-05-01 11:45:00'
+    delays = []
+    for _ in range(8):
+        app.schedule_refresh(['forecast'])
+        delays.append(round(app.time.ticks_diff(app.next_refresh_ticks_ms['forecast'], app.time.ticks_ms()) / 1000))
+    assert delays == [60, 120, 240, 480, 960, 1920, 3600, 3600]
+
+    app.forecast_updtime = '2024-05-01 12:45:00'
+    app.schedule_refresh(['forecast'])
+    assert app.unchanged_fetches['forecast'] == 0
+
+
+def test_stations_covered_by_the_report_keep_its_readings():
+    async def scenario():
+        settings = {'data_source': 'rhrread', 'station': "King's Park", 'station_2': 'Chek Lap Kok'}
+        async with Harness(settings) as h:
+            await h.boot()
+            await h.settle()
+            # Chek Lap Kok is not in the report, so the regional CSV is fetched as well
+            for _ in range(2):
+                h.app.request_refresh(('temperature',))
+                await h.refresh()
+                assert h.app.station_index['temperature']["King's Park"][0] == '28'
+                assert h.app.snapshot.stations[0][1] == '28'
+                assert h.app.snapshot.stations[1][1] == '25'
+    run(scenario())
+
+
+def test_regional_csvs_stand_in_for_a_failing_report():
+    async def scenario():
+        async with Harness({'data_source': 'rhrread', 'station': "King's Park"}) as h:
+            h.server.route('rhrread').drop = True
+            await h.boot()
+            await h.settle()
+            assert h.server.route('latest_1min_temperature.csv').requests == 1
+            assert h.server.route('latest_1min_humidity.csv').requests == 1
+            assert h.app.snapshot.stations[0][1:5:3] == ('26', '68')
+    run(scenario())
+
+
+def test_switching_the_data_source_keeps_the_cached_csv_readings():
+    async def switch(h, data_source):
+        await h.app.on_stop()
+        h.settings['data_source'] = data_source
+        await h.app.on_start()
+        await h.refresh()
+
+    async def scenario():
+        async with Harness({'station': "King's Park"}) as h:
+            h.server.route('latest_1min_temperature.csv').etag = '"temperature-1"'
+            await h.boot()
+            await h.settle()
+            csv = h.app.snapshot.stations
+            await switch(h, 'rhrread')
+            assert h.app.snapshot.stations[0][1] == '28'
+            await switch(h, 'csv')
+            assert h.app.station_index['temperature']["King's Park"] == ('25.8', '2024-05-01 12:30:00')
+            assert h.app.snapshot.stations == csv
+    run(scenario())
+
+
+def test_connection_reuse_is_reported():
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            for _ in range(3):
+                h.app.request_refresh()
+                await h.refresh()
+            session = h.app.hko_session
+            assert h.server.connections == session.handshakes <= h.app.HTTP_POOL_SIZE
+            assert session.reused == h.server.requests - session.handshakes > 0
+
+            exported = h.app.export_metrics()['hko_connections']
+            assert exported == {'handshakes': session.handshakes, 'handshake_ms': session.handshake_ms,
+                                'reused': session.reused, 'saved_ms': session.saved_ms()}
+            h.app.show_diagnostics(True)
+            assert '{} handshakes'.format(session.handshakes) in h.app.lbl_diagnostics.get_text()
+    run(scenario())
+
+
+def test_polls_reuse_the_connections_between_refreshes():
+    from soak import step
+
+    async def scenario():
+        async with Harness() as h:
+            await h.boot()
+            await h.settle()
+            assert h.app.HTTP_IDLE_TIMEOUT_MS > (h.app.MIN_REFRESH_DELAY + h.app.REFRESH_JITTER) * 1000
+            session = h.app.hko_session
+            handshakes = session.handshakes
+            h.server.reset_counters()
+            elapsed = 0
+            while elapsed < 60 * 60 * 1000:
+                elapsed += await step(h)
+            assert h.server.requests > 60
+            # a burst of due datasets may open the pool again, the polls in between do not
+            assert session.handshakes - handshakes <= h.app.HTTP_POOL_SIZE
+    run(scenario())
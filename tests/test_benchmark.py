@@ -0,0 +1,35 @@
+"""Performance budgets of a refresh, measured as in benchmark.py."""
+
+from benchmark import run_scenario
+from harness import run
+
+
+def test_compression_reduces_bytes_on_the_wire():
+    gzip = run(run_scenario(dict(), {}, repeat=0))[0]
+    plain = run(run_scenario(dict(compress=False), {}, repeat=0))[0]
+    assert gzip['bytes'] < plain['bytes'] / 2
+
+
+def test_one_request_per_dataset():
+    first, again = run(run_scenario(dict(), {}))
+    assert first['requests'] <= 7 and not first['errors']
+    assert again['requests'] <= first['requests']
+
+
+def test_unchanged_data_updates_no_widgets():
+    first, again = run(run_scenario(dict(), {}))
+    assert first['widget_ops'] > 0
+    assert again['widget_ops'] == 0
+
+
+def test_datasets_are_fetched_concurrently():
+    latency = 0.05
+    first = run(run_scenario(dict(latency=latency), {}, repeat=0))[0]
+    assert first['retrieve_ms'] < first['requests'] * latency * 1000
+
+
+def test_larger_bodies_are_not_held_whole():
+    # seven bodies 64 KB larger each, parsed as they arrive
+    small = run(run_scenario(dict(compress=False), dict(chunked=True), repeat=0))[0]
+    large = run(run_scenario(dict(compress=False), dict(chunked=True, padding=64 * 1024), repeat=0))[0]
+    assert large['peak_kb'] - small['peak_kb'] < 3 * 64
@@ -0,0 +1,12 @@
+from harness import run
+from soak import IMAGE_CACHE_BYTES, growth, soak
+
+
+def test_three_hours_of_operation_do_not_grow_the_heap():
+    samples = run(soak(3 * 60 * 60 * 1000))
+    assert samples[-1]['steps'] > 500
+    assert growth(samples) == {}
+    # both caches were in use: unchanged datasets were answered 304, icon files were evicted for others
+    assert all(s['http_cache'] and s['not_modified'] for s in samples)
+    assert all(0 < s['image_cache_kb'] <= IMAGE_CACHE_BYTES / 1024 for s in samples)
+    assert len({s['images'] for s in samples}) > 1